@@ -0,0 +1,150 @@
+import json
+import math
+import threading
+from collections import deque
+
+# Request kinds recorded by the sessions
+RPC = "rpc"
+BATCH = "batch"
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+
+# Timing samples and counters of one (PLC, kind, method) combination
+class RequestStats:
+    def __init__(self, max_samples):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.samples = deque(maxlen=max_samples)
+
+    def add(self, seconds, ok, size):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.samples.append(seconds)
+        if not ok:
+            self.errors += 1
+        if size:
+            self.bytes += size
+
+    # Nearest-rank percentile over the most recent samples
+    def percentile(self, percent):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "total_seconds": self.total_seconds,
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "max_seconds": self.max_seconds,
+            "bytes": self.bytes,
+            "bytes_per_second": self.bytes / self.total_seconds if self.bytes and self.total_seconds else 0.0
+        }
+
+
+# Per-call latency, transfer and error statistics, shared by any number of sessions:
+#
+#     metrics = ApiMetrics()
+#     api = WebApiSession(ip, user, password, metrics=metrics)
+#     ...
+#     print(metrics.to_prometheus())
+#
+# Hooks are called as hook(event) after every request, with event a dict of "plc", "kind", "method",
+# "seconds", "ok" and "bytes" (kind "retry" marks a call replayed after logging in again).
+# Hooks run in the thread (or event loop) that made the request, so they should return quickly.
+class ApiMetrics:
+    def __init__(self, max_samples=1024):
+        self.max_samples = max_samples
+        self._stats = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _get(self, plc, kind, method):
+        key = (plc, kind, method)
+        if key not in self._stats:
+            self._stats[key] = RequestStats(self.max_samples)
+        return self._stats[key]
+
+    def record(self, plc, kind, method, seconds, ok=True, size=None):
+        with self._lock:
+            self._get(plc, kind, method).add(seconds, ok, size)
+        self._notify({"plc": plc, "kind": kind, "method": method, "seconds": seconds, "ok": ok, "bytes": size})
+
+    def record_retry(self, plc, kind, method):
+        with self._lock:
+            self._get(plc, kind, method).retries += 1
+        self._notify({"plc": plc, "kind": "retry", "method": method, "seconds": 0.0, "ok": True, "bytes": None})
+
+    def _notify(self, event):
+        for hook in list(self._hooks):
+            hook(event)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    # {plc: {kind: {method: statistics}}}
+    def snapshot(self):
+        with self._lock:
+            items = [(key, stats.to_dict()) for key, stats in self._stats.items()]
+        snapshot = {}
+        for (plc, kind, method), stats in sorted(items):
+            snapshot.setdefault(plc, {}).setdefault(kind, {})[method] = stats
+        return snapshot
+
+    def to_json(self, indent=1):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    # Prometheus text exposition format
+    def to_prometheus(self, prefix="simatic_web_api"):
+        with self._lock:
+            items = sorted((key, stats.to_dict()) for key, stats in self._stats.items())
+
+        lines = [
+            f"# HELP {prefix}_request_seconds Request latency, including ticket transfers",
+            f"# TYPE {prefix}_request_seconds summary"
+        ]
+        for (plc, kind, method), stats in items:
+            labels = f'plc="{plc}",kind="{kind}",method="{method}"'
+            lines.append(f'{prefix}_request_seconds{{{labels},quantile="0.5"}} {stats["p50_seconds"]:.6f}')
+            lines.append(f'{prefix}_request_seconds{{{labels},quantile="0.95"}} {stats["p95_seconds"]:.6f}')
+            lines.append(f'{prefix}_request_seconds_sum{{{labels}}} {stats["total_seconds"]:.6f}')
+            lines.append(f'{prefix}_request_seconds_count{{{labels}}} {stats["count"]}')
+
+        counters = (("request_seconds_max", "gauge", "Slowest request", "max_seconds"),
+                    ("errors_total", "counter", "Failed requests", "errors"),
+                    ("retries_total", "counter", "Calls replayed after logging in again", "retries"),
+                    ("transferred_bytes_total", "counter", "Bytes uploaded or downloaded through tickets", "bytes"))
+        for name, metric_type, description, field in counters:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for (plc, kind, method), stats in items:
+                if field == "bytes" and kind not in (UPLOAD, DOWNLOAD):
+                    continue
+                labels = f'plc="{plc}",kind="{kind}",method="{method}"'
+                value = stats[field]
+                lines.append(f"{prefix}_{name}{{{labels}}} {value:.6f}" if isinstance(value, float)
+                             else f"{prefix}_{name}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
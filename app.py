@@ -1,7 +1,11 @@
+import logging
+import queue
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
-import os
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 from simatic_web_api import WebApiSession
+from token_cache import TokenCache
+from web_app_deploy import staged_deploy_web_app, sync_web_app
 
 
 class WebAppUploaderGUI:
@@ -16,8 +20,18 @@ class WebAppUploaderGUI:
         self.app_name = tk.StringVar(value="TestApp")
         self.folder_path = tk.StringVar()
         self.default_page_name = tk.StringVar(value="index.html")
+        self.incremental = tk.BooleanVar(value=True)
+        self.file_status = tk.StringVar()
+        self.overall_status = tk.StringVar()
+
+        # The deployment runs in a worker thread; it reports through this queue, drained by _poll_queue()
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+        self.close_when_done = False
 
         self.create_widgets()
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
         # Input fields
@@ -40,18 +54,82 @@ class WebAppUploaderGUI:
         tk.Entry(self.master, textvariable=self.folder_path).grid(row=5, column=1)
         tk.Button(self.master, text="Browse", command=self.browse_folder).grid(row=5, column=2)
 
-        tk.Button(self.master, text="Upload App", command=self.upload_app).grid(row=6, column=0, columnspan=3, pady=10)
+        tk.Checkbutton(self.master, text="Only upload changed files", variable=self.incremental).grid(row=6, column=1, sticky='w')
+
+        buttons = tk.Frame(self.master)
+        buttons.grid(row=7, column=0, columnspan=3, pady=10)
+        self.upload_button = tk.Button(buttons, text="Upload App", command=self.upload_app)
+        self.upload_button.pack(side='left', padx=5)
+        self.cancel_button = tk.Button(buttons, text="Cancel", command=self.cancel, state='disabled')
+        self.cancel_button.pack(side='left', padx=5)
+
+        # Progress of the current file and of all files
+        tk.Label(self.master, text="File:").grid(row=8, column=0, sticky='e')
+        self.file_progress = ttk.Progressbar(self.master, length=300, maximum=1.0)
+        self.file_progress.grid(row=8, column=1, sticky='we')
+        tk.Label(self.master, textvariable=self.file_status, anchor='w').grid(row=9, column=1, columnspan=2, sticky='w')
+
+        tk.Label(self.master, text="Total:").grid(row=10, column=0, sticky='e')
+        self.overall_progress = ttk.Progressbar(self.master, length=300, maximum=1.0)
+        self.overall_progress.grid(row=10, column=1, sticky='we')
+        tk.Label(self.master, textvariable=self.overall_status, anchor='w').grid(row=11, column=1, columnspan=2, sticky='w')
 
         # Logging output box
         self.log_output = scrolledtext.ScrolledText(self.master, width=70, height=20, state='disabled')
-        self.log_output.grid(row=7, column=0, columnspan=3, padx=10, pady=10)
+        self.log_output.grid(row=12, column=0, columnspan=3, padx=10, pady=10)
 
+    # Thread-safe: called from the worker, shown by _poll_queue()
     def log(self, message):
+        self.events.put(("log", message))
+
+    def progress(self, name, sent, total, elapsed):
+        self.events.put(("progress", name, sent, total, elapsed))
+
+    def _show_log(self, lines):
         self.log_output.config(state='normal')
-        self.log_output.insert(tk.END, message + '\n')
+        self.log_output.insert(tk.END, "".join(line + '\n' for line in lines))
         self.log_output.see(tk.END)
         self.log_output.config(state='disabled')
-        self.master.update()
+
+    @staticmethod
+    def _progress_text(sent, total, elapsed):
+        rate = sent / elapsed / 1024 if elapsed > 0 else 0.0
+        return f"{sent / 1024:.0f}/{total / 1024:.0f} kB, {rate:.1f} kB/s"
+
+    # Show everything the worker reported since the last call. Only the latest progress values are
+    # drawn, so a fast upload does not redraw the window for every chunk.
+    def _poll_queue(self):
+        lines = []
+        file_event = overall_event = done_event = None
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "log":
+                lines.append(event[1])
+            elif event[0] == "progress" and event[1] is None:
+                overall_event = event
+            elif event[0] == "progress":
+                file_event = event
+            else:
+                done_event = event
+
+        if lines:
+            self._show_log(lines)
+        if file_event:
+            _, name, sent, total, elapsed = file_event
+            self.file_progress["value"] = sent / total if total else 1.0
+            self.file_status.set(f"{name}: {self._progress_text(sent, total, elapsed)}")
+        if overall_event:
+            _, _, sent, total, elapsed = overall_event
+            self.overall_progress["value"] = sent / total if total else 1.0
+            self.overall_status.set(self._progress_text(sent, total, elapsed))
+
+        if done_event:
+            self._finish(*done_event[1:])
+        else:
+            self.master.after(100, self._poll_queue)
 
     def browse_folder(self):
         folder_selected = filedialog.askdirectory()
@@ -59,75 +137,109 @@ class WebAppUploaderGUI:
             self.folder_path.set(folder_selected)
 
     def upload_app(self):
+        if self.worker is not None:
+            return
         self.log_output.config(state='normal')
         self.log_output.delete(1.0, tk.END)
         self.log_output.config(state='disabled')
-
-        ip = self.ip_address.get()
-        user = self.username.get()
-        pwd = self.password.get()
-        app_name = self.app_name.get()
-        folder = self.folder_path.get()
-        default_page = self.default_page_name.get()
-
+        self.file_progress["value"] = 0
+        self.overall_progress["value"] = 0
+        self.file_status.set("")
+        self.overall_status.set("")
+
+        # Tk variables are read here; the worker thread must not touch any widget
+        settings = {
+            "ip": self.ip_address.get(),
+            "user": self.username.get(),
+            "pwd": self.password.get(),
+            "app_name": self.app_name.get(),
+            "folder": self.folder_path.get(),
+            "default_page": self.default_page_name.get(),
+            "deploy": sync_web_app if self.incremental.get() else staged_deploy_web_app
+        }
+
+        self.cancel_event.clear()
+        self.upload_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.worker = threading.Thread(target=self._run_upload, args=(settings,), daemon=True)
+        self.worker.start()
+        self.master.after(100, self._poll_queue)
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.log("Cancelling...")
+
+    # Runs in the worker thread. Ends with a ("done", status, message) event, status being
+    # "ok", "error" or "cancelled".
+    def _run_upload(self, settings):
         try:
-            api = WebApiSession(ip=ip, username=user, password=pwd)
-
-            self.log("Pinging device...")
-            if not api.ping():
-                self.log("Ping failed.")
-                messagebox.showerror("Error", "Ping failed.")
-                return
-            self.log("Ping result: OK")
-
-            self.log("Logging in...")
-            token = api.login()
-            if not token:
-                self.log("Login failed.")
-                messagebox.showerror("Error", "Login failed.")
-                return
-            self.log(f"Token received: {token}")
-
-            self.log(f"Deleting existing app '{app_name}' if it exists...")
-            result = api.web_app_delete(app_name)
-            self.log(f"Web App Delete result: {result}")
-
-            self.log(f"Creating new app '{app_name}'...")
-            result = api.web_app_create(app_name)
-            self.log(f"Web App Create result: {result}")
-
-            self.log(f"Uploading files from folder: {folder}")
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
-                if os.path.isfile(file_path):
-                    self.log(f"Processing file: {filename}")
-                    ticket_id = api.web_app_create_resource(app_name, filename)
-                    self.log(f"Ticket ID for {filename}: {ticket_id}")
-
-                    result = api.upload_file(ticket_id, file_path)
-                    self.log(f"Upload result for {filename}: {result}")
-
-                    result = api.close_ticket(ticket_id)
-                    self.log(f"Ticket ID {ticket_id} close result: {result}")
-
-            self.log(f"Setting default page to: {default_page}")
-            result = api.web_app_set_default_page(app_name, default_page)
-            self.log(f"Set default page result: {result}")
-
-            self.log("Browsing apps and resources...")
-            api.web_app_browse()
-            api.web_app_browse_resource(app_name)
-
-            api.logout()
-            self.log("Logout complete.")
-            messagebox.showinfo("Success", "Web App uploaded successfully!")
+            with WebApiSession(ip=settings["ip"], username=settings["user"], password=settings["pwd"],
+                               token_cache=TokenCache()) as api:
+                self.log("Pinging device...")
+                if not api.ping():
+                    self.log("Ping failed.")
+                    self.events.put(("done", "error", "Ping failed."))
+                    return
+                self.log("Ping result: OK")
+
+                self.log("Logging in...")
+                token = api.login()
+                if not token:
+                    self.log("Login failed.")
+                    self.events.put(("done", "error", "Login failed."))
+                    return
+                self.log(f"Token received: {token}")
+
+                report = settings["deploy"](api, settings["app_name"], settings["folder"], settings["default_page"],
+                                            log=self.log, progress=self.progress, cancel=self.cancel_event)
+                for resource in report.failed:
+                    self.log(f"Failed: {resource.name}: {resource.error}")
+
+                if not report.cancelled:
+                    self.log("Browsing apps and resources...")
+                    api.web_app_browse()
+                    api.web_app_browse_resource(settings["app_name"])
+
+            self.log("Session closed.")
+            if report.cancelled:
+                self.events.put(("done", "cancelled", "Upload cancelled."))
+            elif not report.ok:
+                # A staged deploy can fail after every upload succeeded, e.g. when the swap fails
+                message = report.error or f"{len(report.failed)} resources failed to upload."
+                self.log(f"Deploy failed: {message}")
+                self.events.put(("done", "error", message))
+            else:
+                self.events.put(("done", "ok", "Web App uploaded successfully!"))
 
         except Exception as e:
             self.log(f"Exception occurred: {e}")
-            messagebox.showerror("Error", str(e))
+            self.events.put(("done", "error", str(e)))
+
+    def _finish(self, status, message):
+        self.worker = None
+        self.upload_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        if self.close_when_done:
+            self.master.destroy()
+        elif status == "ok":
+            messagebox.showinfo("Success", message)
+        elif status == "cancelled":
+            messagebox.showwarning("Cancelled", message)
+        else:
+            messagebox.showerror("Error", message)
+
+    # Closing the window cancels a running upload and closes once its tickets are released
+    def on_close(self):
+        if self.worker is None:
+            self.master.destroy()
+        else:
+            self.close_when_done = True
+            self.cancel()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     root = tk.Tk()
     app = WebAppUploaderGUI(root)
     root.mainloop()
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from mock_plc import MockPlc, MockPlcServer, generate_certificate
+from plc_tags import PlcTags
+from simatic_web_api import WebApiSession
+from web_app_deploy import deploy_web_app, staged_deploy_web_app, sync_web_app
+
+USERNAME = "admin"
+PASSWORD = "admin"
+TRANSFER_SIZES = (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+TAG_COUNT = 200
+TAGS = [f'"Bench".value_{i:03d}' for i in range(TAG_COUNT)]
+
+
+# Web app folder with count files of size bytes each, plus an index.html
+def make_web_app_folder(directory, count=20, size=64 * 1024):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "index.html"), "w", encoding="utf-8") as file:
+        file.write("<html><body>Benchmark</body></html>\n")
+    for i in range(count):
+        with open(os.path.join(directory, f"asset_{i:03d}.js"), "wb") as file:
+            file.write(os.urandom(size))
+    return directory
+
+
+def _session(server, **kwargs):
+    api = WebApiSession(server.address, USERNAME, PASSWORD, response_logging="off", **kwargs)
+    if not api.login():
+        raise RuntimeError(f"Login to mock PLC {server.address} failed")
+    return api
+
+
+def _quiet(message):
+    pass
+
+
+# Scenarios return the bytes they moved; time and server counters are measured by run_scenario
+def scenario_deploy(servers, settings):
+    with _session(servers[0], pool_maxsize=settings["workers"]) as api:
+        report = deploy_web_app(api, "Bench", settings["folder"], "index.html", settings["workers"],
+                                settings["max_open_tickets"], _quiet)
+    if not report.ok:
+        raise RuntimeError(f"Deploy failed: {report.summary()}")
+    return report.total_bytes
+
+
+def scenario_staged_deploy(servers, settings):
+    with _session(servers[0], pool_maxsize=settings["workers"]) as api:
+        report = staged_deploy_web_app(api, "Bench", settings["folder"], "index.html", settings["workers"],
+                                       settings["max_open_tickets"], _quiet)
+    if not report.ok:
+        raise RuntimeError(f"Staged deploy failed: {report.summary()}")
+    return report.total_bytes
+
+
+def scenario_sync_unchanged(servers, settings):
+    with _session(servers[0], pool_maxsize=settings["workers"]) as api:
+        sync_web_app(api, "Bench", settings["folder"], "index.html", settings["workers"],
+                     settings["max_open_tickets"], _quiet)
+    return 0
+
+
+def _scenario_upload(size):
+    def scenario(servers, settings):
+        data = settings["payload"][:size]
+        with _session(servers[0]) as api:
+            ticket_id = api.create_file(f"/UserFiles/bench_{size}.bin")
+            try:
+                if not api.upload_file(ticket_id, data):
+                    raise RuntimeError("Upload failed")
+            finally:
+                api.close_ticket(ticket_id)
+        return size
+    return scenario
+
+
+def _scenario_download(size):
+    def scenario(servers, settings):
+        with _session(servers[0]) as api:
+            content = api.download_resource(f"/UserFiles/bench_{size}.bin", in_memory=True)
+        if content is None or len(content) != size:
+            raise RuntimeError("Download failed")
+        return size
+    return scenario
+
+
+def scenario_fanout(servers, settings):
+    def deploy(server):
+        with _session(server, pool_maxsize=settings["workers"]) as api:
+            return deploy_web_app(api, "Bench", settings["folder"], "index.html", settings["workers"],
+                                  settings["max_open_tickets"], _quiet)
+
+    with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+        reports = list(executor.map(deploy, servers))
+    if not all(report.ok for report in reports):
+        raise RuntimeError("Deploy failed on at least one PLC")
+    return sum(report.total_bytes for report in reports)
+
+
+def scenario_read_tags(servers, settings):
+    with _session(servers[0]) as api:
+        values, valid = PlcTags(api).read_array(TAGS)
+    if not valid.all():
+        raise RuntimeError("Reading tags failed")
+    return values.nbytes
+
+
+# (name, scenario, warm up): scenarios that need state left by an earlier run are run once untimed first
+def scenarios():
+    items = [("deploy", scenario_deploy, False), ("staged_deploy", scenario_staged_deploy, False),
+             ("sync_unchanged", scenario_sync_unchanged, True)]
+    for size in TRANSFER_SIZES:
+        items.append((f"upload_{size // 1024}k", _scenario_upload(size), False))
+        items.append((f"download_{size // 1024}k", _scenario_download(size), False))
+    items.append((f"read_tags_{TAG_COUNT}", scenario_read_tags, False))
+    items.append(("fanout", scenario_fanout, False))
+    return items
+
+
+def _server_counters(server):
+    return server.connections, server.rpc_requests, server.ticket_requests
+
+
+# Run a scenario repeat times and summarize the timings and what the mock servers saw
+def run_scenario(name, scenario, servers, settings, repeat, warm_up=False):
+    if warm_up:
+        scenario(servers, settings)
+    timings = []
+    for _ in range(repeat):
+        before = [_server_counters(server) for server in servers]
+        start_time = time.perf_counter()
+        moved = scenario(servers, settings)
+        timings.append(time.perf_counter() - start_time)
+    # Requests and connections of the last run
+    counts = [sum(counters) for counters in zip(*(
+        [after - first for after, first in zip(_server_counters(server), previous)]
+        for server, previous in zip(servers, before)))]
+
+    median = statistics.median(timings)
+    return {
+        "median_seconds": median,
+        "min_seconds": min(timings),
+        "max_seconds": max(timings),
+        "bytes": moved,
+        "bytes_per_second": moved / median if moved and median else 0.0,
+        "connections": counts[0],
+        "rpc_requests": counts[1],
+        "ticket_requests": counts[2]
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Run all (or the selected) scenarios against fresh mock PLCs and return the report
+def run_benchmarks(settings, selected=None, repeat=3, log=print):
+    report = {
+        "commit": _git_commit(),
+        "date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in settings.items() if key not in ("folder", "payload")},
+        "results": {}
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        settings = dict(settings)
+        settings["folder"] = make_web_app_folder(os.path.join(temp_dir, "app"), settings["files"],
+                                                 settings["file_size"])
+        settings["payload"] = os.urandom(max(TRANSFER_SIZES))
+        certfile, keyfile = generate_certificate(temp_dir)
+
+        servers = []
+        try:
+            for _ in range(settings["plcs"]):
+                plc = MockPlc({USERNAME: PASSWORD}, settings["max_plc_tickets"])
+                for tag in TAGS:
+                    plc.add_tag(tag, "Real", 0.0)
+                # The download scenarios do not depend on the upload scenarios having run first
+                for size in TRANSFER_SIZES:
+                    plc.add_file(f"/UserFiles/bench_{size}.bin", settings["payload"][:size])
+                servers.append(MockPlcServer(plc, latency=settings["latency"],
+                                             handshake_delay=settings["handshake_delay"],
+                                             bandwidth=settings["bandwidth"], certfile=certfile,
+                                             keyfile=keyfile).start())
+
+            for name, scenario, warm_up in scenarios():
+                if selected and name not in selected:
+                    continue
+                result = run_scenario(name, scenario, servers, settings, repeat, warm_up)
+                report["results"][name] = result
+                log(f"{name:16} {result['median_seconds']:8.3f} s  {result['bytes_per_second'] / 1e6:8.2f} MB/s  "
+                    f"{result['rpc_requests']:4} rpc  {result['connections']:3} connections")
+        finally:
+            for server in servers:
+                server.stop()
+    return report
+
+
+# Print the change of each scenario's median time against an earlier report
+def compare_reports(baseline, report, log=print):
+    log(f"Compared with {baseline.get('commit')} ({baseline.get('date')}):")
+    for name, result in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            log(f"{name:16} {result['median_seconds']:8.3f} s  (new)")
+            continue
+        change = (result["median_seconds"] / previous["median_seconds"] - 1) * 100 if previous["median_seconds"] else 0
+        log(f"{name:16} {previous['median_seconds']:8.3f} s -> {result['median_seconds']:8.3f} s  {change:+6.1f} %")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark deployments and transfers against mock PLCs.")
+    parser.add_argument("-o", "--output", help="write the report as JSON (default: benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--scenario", action="append", help="run only this scenario, can be repeated")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the median is reported")
+    parser.add_argument("--files", type=int, default=20, help="files in the benchmark web app")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="size of each web app file in bytes")
+    parser.add_argument("--workers", type=int, default=4, help="parallel uploads per PLC")
+    parser.add_argument("--max-open-tickets", type=int, default=8, help="tickets opened per batch by the client")
+    parser.add_argument("--plcs", type=int, default=4, help="mock PLCs for the fan-out scenario")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds the mock adds to every request")
+    parser.add_argument("--handshake-delay", type=float, default=0.05, help="seconds the mock adds to every new connection")
+    parser.add_argument("--bandwidth", type=float, default=10e6, help="mock transfer limit in bytes per second")
+    parser.add_argument("--max-plc-tickets", type=int, default=8, help="open tickets the mock PLC allows")
+    args = parser.parse_args(argv)
+
+    settings = {
+        "files": args.files,
+        "file_size": args.file_size,
+        "workers": args.workers,
+        "max_open_tickets": args.max_open_tickets,
+        "plcs": args.plcs,
+        "latency": args.latency,
+        "handshake_delay": args.handshake_delay,
+        "bandwidth": args.bandwidth,
+        "max_plc_tickets": args.max_plc_tickets
+    }
+    report = run_benchmarks(settings, args.scenario, args.repeat)
+
+    output = args.output or f"benchmark-{report['commit'] or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=1)
+    print(f"Report written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare_reports(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
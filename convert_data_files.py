@@ -0,0 +1,219 @@
+import argparse
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from plc_data_file import DataFile, DEFAULT_BYTEORDER, field_key, unpack_states
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("csv", "json", "jsonl", "parquet", "arrow", "bundle")
+
+# Records converted per chunk; bounds memory use regardless of file size
+CHUNK_RECORDS = 65536
+
+
+# Metadata keyed like binaryDownloader.js, StartTime in the same ISO 8601 form as JavaScript's toISOString()
+def metadata_values(data_file):
+    values = {}
+    for field in data_file.config["metadata"]:
+        value = data_file.header[field["name"]]
+        if isinstance(value, np.datetime64):
+            value = np.datetime_as_string(value, unit="ms") + "Z"
+        values[field_key(field)] = value
+    return values
+
+
+def _value_columns(data_file):
+    return [field for field in data_file.config["record"] if not field.get("bits")]
+
+
+def _number_strings(values, nan="NaN", infinity="Infinity"):
+    strings = values.astype(np.float64).astype(str) if values.dtype.kind == "f" else values.astype(str)
+    if values.dtype.kind == "f":
+        strings[np.isnan(values)] = nan
+        strings[np.isposinf(values)] = infinity
+        strings[np.isneginf(values)] = "null" if infinity == "null" else "-" + infinity
+    return strings
+
+
+# Index and value columns of a chunk as strings, shared by the CSV and JSON writers
+def _chunk_columns(data_file, start, stop, nan="NaN", infinity="Infinity"):
+    records = np.asarray(data_file.records[start:stop])  # plain ndarray, iterating a memmap subclass is slow
+    columns = [np.arange(start + 1, stop + 1).astype(str)]
+    for field in _value_columns(data_file):
+        columns.append(_number_strings(records[field["name"]], nan, infinity))
+    return records, columns
+
+
+def _chunks(data_file, chunk_records):
+    for start in range(0, len(data_file), chunk_records):
+        yield start, min(start + chunk_records, len(data_file))
+
+
+# BinaryStates of a chunk rendered as one string per record. State words repeat a lot, so each
+# distinct word is formatted once and the results are gathered with a vectorized lookup.
+# templates holds one "%s" format per bit, in bit_names order.
+def _state_strings(data_file, start, stop, templates, separator):
+    unique, inverse = np.unique(data_file.records["BinaryStates"][start:stop], return_inverse=True)
+    bits = unpack_states(unique)
+    formatted = np.array([separator.join(template % ("true" if bit else "false") for template, bit in zip(templates, row))
+                          for row in bits], dtype=object)
+    return formatted[inverse.reshape(-1)]
+
+
+# CSV in the same layout as binaryDownloader.js: a metadata block, then ";" separated records
+def write_csv(data_file, out, chunk_records=CHUNK_RECORDS):
+    out.write("Metadata\n")
+    out.write("\n".join(f'"{key}";"{value}"' for key, value in metadata_values(data_file).items()) + "\n\n")
+    if not len(data_file):
+        return
+
+    out.write("Records\n")
+    headers = ["Index"] + [field_key(field) for field in _value_columns(data_file)]
+    headers += [f"Bin_{name}" for name in data_file.bit_names]
+    out.write(";".join(f'"{header}"' for header in headers) + "\n")
+
+    for start, stop in _chunks(data_file, chunk_records):
+        _, columns = _chunk_columns(data_file, start, stop)
+        columns.append(_state_strings(data_file, start, stop, ["%s"] * len(data_file.bit_names), ";"))
+        out.write("".join(";".join(row) + "\n" for row in zip(*columns)))
+
+
+def _json_records(data_file, start, stop):
+    records, columns = _chunk_columns(data_file, start, stop, nan="null", infinity="null")
+    keys = [field_key(field) for field in _value_columns(data_file)]
+    states = records["BinaryStates"].astype(np.int64).astype(str)
+    bits = _state_strings(data_file, start, stop, [f'"Bin_{name}": %s' for name in data_file.bit_names], ", ")
+    # Same key order as binaryDownloader.js: values, BinaryStates, Index, bits
+    template = "{" + ", ".join(f'"{key}": %s' for key in keys) + ', "BinaryStates": %s, "Index": %s, %s}'
+    for row in zip(*columns[1:], states, columns[0], bits):
+        yield template % row
+
+
+# JSON with the same structure as binaryDownloader.js ({"metadata": ..., "records": [...]}), one record per line
+def write_json(data_file, out, chunk_records=CHUNK_RECORDS):
+    out.write('{"metadata": ' + json.dumps(metadata_values(data_file)) + ', "records": [')
+    separator = "\n"
+    for start, stop in _chunks(data_file, chunk_records):
+        out.write(separator + ",\n".join(_json_records(data_file, start, stop)))
+        separator = ",\n"
+    out.write("\n]}\n")
+
+
+# JSON Lines: a metadata line followed by one record per line
+def write_jsonl(data_file, out, chunk_records=CHUNK_RECORDS):
+    out.write(json.dumps({"metadata": metadata_values(data_file)}) + "\n")
+    for start, stop in _chunks(data_file, chunk_records):
+        out.write("".join(record + "\n" for record in _json_records(data_file, start, stop)))
+
+
+TEXT_WRITERS = {"csv": write_csv, "json": write_json, "jsonl": write_jsonl}
+
+
+def _arrow_table(data_file, start, stop):
+    columns = {"Index": np.arange(start + 1, stop + 1, dtype=np.int64)}
+    for field in data_file.config["record"]:
+        columns[field_key(field)] = data_file.field(field["name"])[start:stop]
+    states = unpack_states(data_file.records["BinaryStates"][start:stop])
+    for i, name in enumerate(data_file.bit_names):
+        columns[f"Bin_{name}"] = states[:, i]
+    metadata = {"metadata": json.dumps(metadata_values(data_file))}
+    return pyarrow.table(columns).replace_schema_metadata(metadata)
+
+
+# Columnar output (Parquet or Arrow IPC), written one row group per chunk
+def write_columnar(data_file, path, file_format="parquet", chunk_records=CHUNK_RECORDS):
+    if pyarrow is None:
+        raise RuntimeError("Parquet/Arrow output requires the pyarrow package")
+    writer = None
+    try:
+        for start, stop in list(_chunks(data_file, chunk_records)) or [(0, 0)]:
+            table = _arrow_table(data_file, start, stop)
+            if writer is None:
+                if file_format == "parquet":
+                    writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+                else:
+                    writer = pyarrow.ipc.new_file(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# <name>_bundle.zip with the original file, JSON and CSV, written straight into the archive
+def write_bundle(data_file, source_path, path, chunk_records=CHUNK_RECORDS):
+    base = os.path.splitext(os.path.basename(source_path))[0]
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.write(source_path, os.path.basename(source_path))
+        for name, writer in ((f"{base}.json", write_json), (f"{base}.csv", write_csv)):
+            with io.TextIOWrapper(bundle.open(name, "w", force_zip64=True), encoding="utf-8", newline="") as out:
+                writer(data_file, out, chunk_records)
+
+
+# Convert one file into the requested formats. Returns (path, record count, seconds).
+def convert_file(path, output_dir, formats=("csv", "json"), byteorder=DEFAULT_BYTEORDER, chunk_records=CHUNK_RECORDS):
+    start_time = time.perf_counter()
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+    with DataFile.open(path, byteorder) as data_file:
+        for file_format in formats:
+            if file_format in TEXT_WRITERS:
+                with open(f"{base}.{file_format}", "w", encoding="utf-8", newline="") as out:
+                    TEXT_WRITERS[file_format](data_file, out, chunk_records)
+            elif file_format in ("parquet", "arrow"):
+                write_columnar(data_file, f"{base}.{file_format}", file_format, chunk_records)
+            elif file_format == "bundle":
+                write_bundle(data_file, path, f"{base}_bundle.zip", chunk_records)
+            else:
+                raise ValueError(f"Unknown format: {file_format}")
+        count = len(data_file)
+    return path, count, time.perf_counter() - start_time
+
+
+# Convert all .bin files of a directory using a pool of processes, one file per task
+def convert_directory(input_dir, output_dir, formats=("csv", "json"), byteorder=DEFAULT_BYTEORDER,
+                      jobs=None, chunk_records=CHUNK_RECORDS, log=print):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir) if name.lower().endswith(".bin"))
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(convert_file, path, output_dir, formats, byteorder, chunk_records): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                path, count, seconds = future.result()
+            except Exception as e:
+                log(f"Error converting {futures[future]}: {e}")
+                continue
+            log(f"Converted {os.path.basename(path)}: {count} records in {seconds:.2f} s")
+            results.append((path, count, seconds))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert harvested PLC test data files (.bin) to CSV/JSON/Parquet.")
+    parser.add_argument("input_dir", help="directory with .bin files")
+    parser.add_argument("output_dir", nargs="?", help="output directory (default: input directory)")
+    parser.add_argument("-f", "--format", action="append", choices=FORMATS, dest="formats",
+                        help="output format, can be repeated (default: bundle)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--byteorder", choices=("big", "little"), default="big", help="byte order of the files")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    results = convert_directory(args.input_dir, args.output_dir or args.input_dir, tuple(args.formats or ["bundle"]),
+                                args.byteorder, args.jobs)
+    total = sum(count for _, count, _ in results)
+    print(f"Converted {len(results)} files, {total} records in {time.perf_counter() - start_time:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
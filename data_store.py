@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+import numpy as np
+from plc_data_file import CONFIG, DEFAULT_BYTEORDER, _check_byteorder, header_size, read_header, record_dtype
+
+CATALOG_NAME = "data_catalog.json"
+
+
+# Convert a datetime64, datetime, ISO 8601 string or nanosecond count to numpy.datetime64[ns].
+# Aware datetimes are converted to UTC; naive values are taken as they are, like the PLC's LDT.
+def to_datetime64(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        value = value.rstrip("Z")
+    return np.datetime64(value, "ns")
+
+
+# Header and size of one file, as stored in the catalog
+def _catalog_entry(path, byteorder, config):
+    stat = os.stat(path)
+    with open(path, "rb") as file:
+        header = read_header(file.read(header_size(config)), byteorder, config)
+    return {
+        "identifier": header["Identifier"],
+        "test_name": header["TestName"],
+        "operator": header["TestOperator"],
+        "file_number": header["FileNumber"],
+        "start_ns": int(header["StartTime"].astype("i8")),
+        "interval_ms": header["SamplingInterval"],
+        "records": (stat.st_size - header_size(config)) // record_dtype(byteorder, config).itemsize,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime
+    }
+
+
+# Time-indexed store over the test data files (.bin) below a directory, e.g. a harvest mirror.
+#
+#     store = DataStore("mirror")
+#     times, values = store.query("Test-2012-01-01-031728", "PressureIn", "2012-01-01T10:05", "2012-01-01T10:07")
+#
+# A catalog of the file headers, grouped by test identifier, is kept in data_catalog.json and only
+# files that changed since the last scan are read again. Timestamps are not stored in the files; they
+# are StartTime + SamplingInterval x record index. A test split over several files continues where the
+# previous file ended when the files repeat the test's StartTime, otherwise each file's own StartTime
+# is used. Queries map only the byte range of the records they need from each file.
+class DataStore:
+    def __init__(self, directory, byteorder=DEFAULT_BYTEORDER, config=CONFIG):
+        self.directory = directory
+        self.byteorder = _check_byteorder(byteorder)
+        self.config = config
+        self.dtype = record_dtype(self.byteorder, config)
+        self.files = {}
+        self.tests = {}
+        self._first_ns = {}
+        self.refresh()
+
+    @property
+    def catalog_path(self):
+        return os.path.join(self.directory, CATALOG_NAME)
+
+    def _load_catalog(self):
+        try:
+            with open(self.catalog_path, encoding="utf-8") as file:
+                catalog = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if catalog.get("byteorder") != self.byteorder:
+            return {}
+        return catalog.get("files", {})
+
+    def _save_catalog(self):
+        temp_path = f"{self.catalog_path}.part"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"byteorder": self.byteorder, "files": self.files}, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.catalog_path)
+
+    # Scan the directory for new, changed and removed files. Returns the number of headers read.
+    def refresh(self):
+        known = self._load_catalog()
+        files = {}
+        read = 0
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.lower().endswith(".bin"):
+                    continue
+                path = os.path.join(folder, name)
+                key = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                stat = os.stat(path)
+                entry = known.get(key)
+                if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+                    try:
+                        entry = _catalog_entry(path, self.byteorder, self.config)
+                    except ValueError:
+                        continue
+                    read += 1
+                files[key] = entry
+
+        self.files = files
+        if read or files.keys() != known.keys():
+            self._save_catalog()
+        self._index()
+        return read
+
+    # Order each test's files and work out where each one starts
+    def _index(self):
+        self.tests = {}
+        self._first_ns = {}
+        for key, entry in self.files.items():
+            self.tests.setdefault(entry["identifier"], []).append(key)
+
+        for keys in self.tests.values():
+            keys.sort(key=lambda key: self.files[key]["file_number"])
+            start_ns = self.files[keys[0]]["start_ns"]
+            offset = 0
+            for key in keys:
+                entry = self.files[key]
+                if entry["start_ns"] == start_ns:
+                    self._first_ns[key] = start_ns + offset * entry["interval_ms"] * 1_000_000
+                else:
+                    self._first_ns[key] = entry["start_ns"]
+                offset += entry["records"]
+
+    # Timestamp of the last record of a file in nanoseconds
+    def _last_ns(self, key):
+        entry = self.files[key]
+        return self._first_ns[key] + max(entry["records"] - 1, 0) * entry["interval_ms"] * 1_000_000
+
+    # {identifier: {"test_name", "operator", "files", "records", "start", "end"}}
+    def list_tests(self):
+        tests = {}
+        for identifier, keys in self.tests.items():
+            entries = [self.files[key] for key in keys]
+            tests[identifier] = {
+                "test_name": entries[0]["test_name"],
+                "operator": entries[0]["operator"],
+                "files": len(entries),
+                "records": sum(entry["records"] for entry in entries),
+                "start": np.datetime64(self._first_ns[keys[0]], "ns"),
+                "end": np.datetime64(self._last_ns(keys[-1]), "ns")
+            }
+        return tests
+
+    # Records of a test within [start, stop], per file: yields (timestamps, records) with records a
+    # structured array mapped over just that part of the file. start and stop are inclusive, None for open.
+    def iter_range(self, identifier, start=None, stop=None):
+        if identifier not in self.tests:
+            raise KeyError(f"Unknown test: {identifier}")
+        start_ns = int(to_datetime64(start).astype("i8")) if start is not None else None
+        stop_ns = int(to_datetime64(stop).astype("i8")) if stop is not None else None
+
+        for key in self.tests[identifier]:
+            entry = self.files[key]
+            first_ns = self._first_ns[key]
+            interval_ns = entry["interval_ms"] * 1_000_000
+            first, last = 0, entry["records"]
+            if interval_ns > 0:
+                if start_ns is not None:
+                    first = max(first, -(-(start_ns - first_ns) // interval_ns))
+                if stop_ns is not None:
+                    last = min(last, (stop_ns - first_ns) // interval_ns + 1)
+            if first >= last:
+                continue
+
+            path = os.path.join(self.directory, *key.split("/"))
+            offset = header_size(self.config) + first * self.dtype.itemsize
+            records = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=(last - first,))
+            timestamps = np.datetime64(first_ns, "ns") + np.arange(first, last) * np.timedelta64(interval_ns, "ns")
+            yield timestamps, records
+
+    # One field of a test within [start, stop] as (timestamps, native-endian values)
+    def query(self, identifier, field, start=None, stop=None):
+        times, values = [], []
+        for timestamps, records in self.iter_range(identifier, start, stop):
+            times.append(timestamps)
+            values.append(records[field].astype(self.dtype[field].newbyteorder("=")))
+        if not times:
+            return np.empty(0, dtype="datetime64[ns]"), np.empty(0, dtype=self.dtype[field].newbyteorder("="))
+        return np.concatenate(times), np.concatenate(values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List and query harvested PLC test data files.")
+    parser.add_argument("directory", help="directory with .bin files, searched recursively")
+    parser.add_argument("--test", help="test identifier to query (default: list the tests)")
+    parser.add_argument("--field", action="append", help="record field to output, can be repeated (default: all)")
+    parser.add_argument("--start", help="first timestamp, e.g. 2012-01-01T10:05:00")
+    parser.add_argument("--stop", help="last timestamp")
+    parser.add_argument("--byteorder", choices=("big", "little"), default="big", help="byte order of the files")
+    args = parser.parse_args(argv)
+
+    store = DataStore(args.directory, args.byteorder)
+    if not args.test:
+        for identifier, test in sorted(store.list_tests().items()):
+            print(f"{identifier:34} {test['files']:3} files {test['records']:9} records  {test['start']} - {test['end']}"
+                  f"  {test['test_name']}")
+        return
+
+    fields = args.field or [name for name in store.dtype.names]
+    print(",".join(["Time"] + fields))
+    for timestamps, records in store.iter_range(args.test, args.start, args.stop):
+        columns = [np.datetime_as_string(timestamps, unit="ms")] + [records[field].astype(str) for field in fields]
+        sys.stdout.write("".join(",".join(row) + "\n" for row in zip(*columns)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from simatic_web_api import WebApiSession
+from token_cache import TokenCache
+from web_app_deploy import LocalWebApp, staged_deploy_web_app, sync_web_app
+
+
+# Read the PLC inventory, a JSON list of objects or a CSV file with a header row.
+# Fields: ip, username, credential (name of the environment variable or credentials file entry
+# holding the password), app_name and default_page. Missing fields are taken from defaults.
+def load_inventory(path, defaults=None):
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.lower().endswith(".json"):
+            rows = json.load(file)
+        else:
+            rows = list(csv.DictReader(file))
+
+    targets = []
+    for row in rows:
+        target = dict(defaults or {})
+        target.update({key: value for key, value in row.items() if value not in (None, "")})
+        if not target.get("ip"):
+            raise ValueError(f"Inventory entry without ip: {row}")
+        targets.append(target)
+    return targets
+
+
+# Password of a target: from the credentials file ({reference: password}) if it has the reference,
+# otherwise from the environment variable of that name
+def resolve_password(target, credentials=None):
+    reference = target.get("credential")
+    if not reference:
+        return target.get("password", "")
+    if credentials and reference in credentials:
+        return credentials[reference]
+    if reference in os.environ:
+        return os.environ[reference]
+    raise KeyError(f"No password for credential '{reference}'")
+
+
+# Outcome of deploying to one PLC
+class TargetResult:
+    def __init__(self, target):
+        self.ip = target["ip"]
+        self.app_name = target.get("app_name")
+        self.report = None
+        self.error = None
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None and self.report is not None and self.report.ok
+
+    def summary(self):
+        if self.error:
+            return f"{self.ip:20} FAILED  {self.error}"
+        status = "ok" if self.ok else "FAILED"
+        return f"{self.ip:20} {status:7} {self.report.summary()}"
+
+
+# Deploy one LocalWebApp to many PLCs at once. The app is read and hashed once by the caller;
+# every target gets its own session.
+#
+# targets:     inventory entries (see load_inventory)
+# parallel:    PLCs deployed at the same time
+# workers:     uploads running at the same time per PLC
+# incremental: sync only changed files (sync_web_app) instead of uploading the whole app (staged_deploy_web_app)
+# log:         called with messages prefixed by the PLC address, from the target threads but one call at a time
+# Returns the TargetResults in inventory order.
+def deploy_fleet(targets, local_app, parallel=8, workers=4, max_open_tickets=8, incremental=True, credentials=None,
+                 token_cache=None, log=print):
+    deploy = sync_web_app if incremental else staged_deploy_web_app
+    log_lock = threading.Lock()
+
+    def target_log(ip, message):
+        with log_lock:
+            log(f"{ip}: {message}")
+
+    def deploy_target(target):
+        result = TargetResult(target)
+        start_time = time.perf_counter()
+
+        try:
+            password = resolve_password(target, credentials)
+            with WebApiSession(target["ip"], target.get("username", "admin"), password, pool_maxsize=workers,
+                               token_cache=token_cache) as api:
+                if not api.login():
+                    raise RuntimeError("Login failed")
+                result.report = deploy(api, target["app_name"], local_app, target.get("default_page"),
+                                       workers, max_open_tickets, lambda message: target_log(result.ip, message))
+        except Exception as e:
+            result.error = str(e)
+        result.seconds = time.perf_counter() - start_time
+        return result
+
+    results = [None] * len(targets)
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {executor.submit(deploy_target, target): i for i, target in enumerate(targets)}
+        for future in as_completed(futures):
+            result = future.result()
+            target_log(result.ip, f"{'done' if result.ok else 'failed'} in {result.seconds:.2f} s")
+            results[futures[future]] = result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deploy a web app to many PLCs.")
+    parser.add_argument("inventory", help="JSON or CSV file with ip, username, credential, app_name, default_page")
+    parser.add_argument("folder", nargs="?", default="web_files", help="web app folder (default: web_files)")
+    parser.add_argument("--app-name", help="app name for entries without one")
+    parser.add_argument("--default-page", default="index.html", help="default page for entries without one")
+    parser.add_argument("--username", default="admin", help="user for entries without one")
+    parser.add_argument("--credentials", help="JSON file mapping credential references to passwords")
+    parser.add_argument("-p", "--parallel", type=int, default=8, help="PLCs deployed at the same time")
+    parser.add_argument("--workers", type=int, default=4, help="uploads at the same time per PLC")
+    parser.add_argument("--max-open-tickets", type=int, default=8)
+    parser.add_argument("--full", action="store_true", help="upload the whole app into a staged copy instead of syncing changes")
+    parser.add_argument("--token-cache", action="store_true", help="reuse sessions across runs")
+    args = parser.parse_args(argv)
+
+    defaults = {"username": args.username, "default_page": args.default_page}
+    if args.app_name:
+        defaults["app_name"] = args.app_name
+    targets = load_inventory(args.inventory, defaults)
+    missing = [target["ip"] for target in targets if not target.get("app_name")]
+    if missing:
+        parser.error(f"No app name for {', '.join(missing)}; set it in the inventory or with --app-name")
+
+    credentials = None
+    if args.credentials:
+        with open(args.credentials, encoding="utf-8") as file:
+            credentials = json.load(file)
+
+    start_time = time.perf_counter()
+    local_app = LocalWebApp(args.folder)
+    print(f"Read {len(local_app.files)} files, {local_app.total_bytes} bytes from {args.folder}")
+
+    results = deploy_fleet(targets, local_app, args.parallel, args.workers, args.max_open_tickets, not args.full,
+                           credentials, TokenCache() if args.token_cache else None)
+
+    print()
+    for result in results:
+        print(result.summary())
+    failed = sum(1 for result in results if not result.ok)
+    print(f"Deployed to {len(results) - failed}/{len(results)} PLCs in {time.perf_counter() - start_time:.2f} s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
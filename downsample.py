@@ -0,0 +1,224 @@
+import argparse
+import os
+import numpy as np
+from plc_data_file import DEFAULT_BYTEORDER, DataFile, _check_byteorder, unpack_states
+
+# Records read per step; bounds memory use regardless of file size (rounded down to whole buckets)
+CHUNK_RECORDS = 65536
+
+# Bucket sizes (records) of the precomputed levels; each level is built from the one before
+PYRAMID_LEVELS = (16, 256, 4096, 65536)
+
+
+def _value_fields(data_file):
+    return [field["name"] for field in data_file.config["record"] if not field.get("bits")]
+
+
+def _state_field(data_file):
+    return next((field["name"] for field in data_file.config["record"] if field.get("bits")), None)
+
+
+# Aggregate of consecutive buckets as a dict of arrays, one entry per bucket:
+# "index" (first record), "count", "<field>_<aggregate>" for each value field and, for the bit field,
+# "<field>_changes" with a (buckets, 32) array of state changes per bit (columns in bit_names order).
+# A change is counted in the bucket of the record that has the new state. NaN values are ignored
+# by min, max and mean (mean is NaN if a bucket has no numbers); "<field>_valid" counts the numbers.
+def _aggregate_chunk(data_file, start, stop, bucket, previous_state):
+    records = data_file.records[start:stop]
+    starts = np.arange(0, len(records), bucket)
+    counts = np.diff(np.append(starts, len(records)))
+    result = {"index": (start + starts).astype(np.int64), "count": counts.astype(np.uint32)}
+
+    for name in _value_fields(data_file):
+        values = records[name].astype(records.dtype[name].newbyteorder("="))
+        numbers = ~np.isnan(values)
+        result[f"{name}_min"] = np.fmin.reduceat(values, starts)
+        result[f"{name}_max"] = np.fmax.reduceat(values, starts)
+        sums = np.add.reduceat(np.where(numbers, values, 0).astype(np.float64), starts)
+        valid = np.add.reduceat(numbers, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[f"{name}_mean"] = sums / valid
+        result[f"{name}_valid"] = valid.astype(np.uint32)
+        result[f"{name}_first"] = values[starts]
+        result[f"{name}_last"] = values[starts + counts - 1]
+
+    state_field = _state_field(data_file)
+    if state_field:
+        states = records[state_field].astype(np.uint32)
+        before = np.concatenate(([states[0] if previous_state is None else previous_state], states[:-1]))
+        changed = unpack_states(states ^ before)
+        result[f"{state_field}_changes"] = np.add.reduceat(changed.astype(np.uint32), starts, axis=0)
+        previous_state = states[-1]
+    return result, previous_state
+
+
+# Downsample a DataFile into buckets of bucket records, yielding the aggregates chunk by chunk
+# (see _aggregate_chunk), so only chunk_records raw records are in memory at a time
+def iter_downsample(data_file, bucket, chunk_records=CHUNK_RECORDS, start=0, stop=None):
+    stop = len(data_file) if stop is None else min(stop, len(data_file))
+    step = max(bucket, chunk_records // bucket * bucket)
+    previous_state = None
+    for chunk_start in range(start, stop, step):
+        result, previous_state = _aggregate_chunk(data_file, chunk_start, min(chunk_start + step, stop), bucket,
+                                                  previous_state)
+        yield result
+
+
+def _concatenate(chunks):
+    chunks = list(chunks)
+    if not chunks:
+        return {}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+# Downsample a whole DataFile into one dict of arrays
+def downsample(data_file, bucket, chunk_records=CHUNK_RECORDS):
+    return _concatenate(iter_downsample(data_file, bucket, chunk_records))
+
+
+# Combine the aggregates of a finer level into buckets of factor of its buckets
+def merge_level(level, factor):
+    starts = np.arange(0, len(level["index"]), factor)
+    last = np.append(starts[1:], len(level["index"])) - 1
+    result = {"index": level["index"][starts], "count": np.add.reduceat(level["count"], starts)}
+    for name, values in level.items():
+        if name.endswith("_min"):
+            result[name] = np.fmin.reduceat(values, starts)
+        elif name.endswith("_max"):
+            result[name] = np.fmax.reduceat(values, starts)
+        elif name.endswith("_mean"):
+            # Weighted by the numbers (not NaN) each bucket's mean was computed from
+            weights = level[f"{name[:-len('_mean')]}_valid"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[name] = (np.add.reduceat(np.nan_to_num(values) * weights, starts)
+                                / np.add.reduceat(weights, starts))
+        elif name.endswith("_valid"):
+            result[name] = np.add.reduceat(values, starts)
+        elif name.endswith("_first"):
+            result[name] = values[starts]
+        elif name.endswith("_last"):
+            result[name] = values[last]
+        elif name.endswith("_changes"):
+            result[name] = np.add.reduceat(values, starts, axis=0)
+    return result
+
+
+# Path of the pyramid cached next to a data file
+def pyramid_path(path):
+    return f"{path}.pyramid.npz"
+
+
+# Multi-resolution aggregates of a data file, cached next to it as <file>.pyramid.npz.
+# The cache is rebuilt when the file's size or modification time changes (e.g. a test still running),
+# or when it was built with another byte order or other levels.
+#
+#     pyramid = Pyramid.open("Test-2012-01-01-031728_00001.bin")
+#     level = pyramid.select(max_buckets=2000)
+#     times = pyramid.timestamps(level)
+#
+# Only the finest level is computed from the raw records (streamed in chunks); coarser levels are
+# merged from it, and reading a cached pyramid does not touch the records at all.
+class Pyramid:
+    def __init__(self, levels, header, records):
+        self.levels = levels
+        self.header = header
+        self.records = records
+
+    @classmethod
+    def open(cls, path, byteorder=DEFAULT_BYTEORDER, levels=PYRAMID_LEVELS, cache=True):
+        byteorder = _check_byteorder(byteorder)
+        stat = os.stat(path)
+        cache_path = pyramid_path(path)
+        if cache and os.path.exists(cache_path):
+            pyramid = cls._load(cache_path, stat, byteorder, levels)
+            if pyramid is not None:
+                return pyramid
+
+        with DataFile.open(path, byteorder) as data_file:
+            pyramid = cls.build(data_file, levels)
+        if cache:
+            pyramid._save(cache_path, stat, byteorder)
+        return pyramid
+
+    @classmethod
+    def build(cls, data_file, levels=PYRAMID_LEVELS, chunk_records=CHUNK_RECORDS):
+        built = {levels[0]: downsample(data_file, levels[0], chunk_records)}
+        for finer, coarser in zip(levels, levels[1:]):
+            if coarser % finer:
+                raise ValueError(f"Level {coarser} is not a multiple of level {finer}")
+            built[coarser] = merge_level(built[finer], coarser // finer) if built[finer] else {}
+        return cls(built, dict(data_file.header), len(data_file))
+
+    def _save(self, cache_path, stat, byteorder):
+        arrays = {f"{bucket}/{name}": values for bucket, level in self.levels.items() for name, values in level.items()}
+        arrays["source"] = np.array([stat.st_size, stat.st_mtime_ns, self.records], dtype=np.int64)
+        arrays["byteorder"] = np.array(byteorder)
+        arrays["levels"] = np.array(sorted(self.levels), dtype=np.int64)
+        arrays["start_time"] = np.array(self.header["StartTime"], dtype="datetime64[ns]")
+        arrays["interval_ms"] = np.array(self.header["SamplingInterval"], dtype=np.int64)
+        temp_path = f"{cache_path}.part.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, cache_path)
+
+    @classmethod
+    def _load(cls, cache_path, stat, byteorder, levels):
+        try:
+            with np.load(cache_path) as cached:
+                size, mtime_ns, records = cached["source"]
+                if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                    return None
+                if str(cached["byteorder"]) != byteorder or cached["levels"].tolist() != sorted(levels):
+                    return None
+                built = {bucket: {} for bucket in levels}
+                for key in cached.files:
+                    bucket, _, name = key.partition("/")
+                    if name and int(bucket) in built:
+                        built[int(bucket)][name] = cached[key]
+                header = {"StartTime": cached["start_time"][()], "SamplingInterval": int(cached["interval_ms"])}
+        except (OSError, ValueError, KeyError):
+            return None
+        if records and not all(built.values()):
+            return None
+        return cls(built, header, int(records))
+
+    # The finest level with at most max_buckets buckets in records [start, stop), sliced to that range.
+    # The coarsest level is returned if none is small enough.
+    def select(self, max_buckets, start=0, stop=None):
+        stop = self.records if stop is None else stop
+        for bucket in sorted(self.levels):
+            if -(-(stop - start) // bucket) <= max_buckets or bucket == max(self.levels):
+                return self.slice(bucket, start, stop)
+
+    # The buckets of one level that overlap records [start, stop)
+    def slice(self, bucket, start=0, stop=None):
+        level = self.levels[bucket]
+        if not level:
+            return {}
+        stop = self.records if stop is None else stop
+        first = np.searchsorted(level["index"], start, side="right") - 1
+        last = np.searchsorted(level["index"], stop, side="left")
+        return {name: values[max(first, 0):last] for name, values in level.items()}
+
+    # Timestamps of the first record of each bucket
+    def timestamps(self, level):
+        interval = np.timedelta64(self.header["SamplingInterval"], "ms")
+        return self.header["StartTime"] + level["index"] * interval
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build downsampling pyramids for PLC test data files.")
+    parser.add_argument("paths", nargs="+", help=".bin files")
+    parser.add_argument("--byteorder", choices=("big", "little"), default="big", help="byte order of the files")
+    parser.add_argument("--rebuild", action="store_true", help="ignore cached pyramids")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        if args.rebuild and os.path.exists(pyramid_path(path)):
+            os.remove(pyramid_path(path))
+        pyramid = Pyramid.open(path, args.byteorder)
+        sizes = ", ".join(f"{bucket}: {len(level.get('index', ()))}" for bucket, level in pyramid.levels.items())
+        print(f"{path}: {pyramid.records} records, buckets per level {sizes}")
+
+
+if __name__ == "__main__":
+    main()
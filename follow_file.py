@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import threading
+import time
+import numpy as np
+from plc_data_file import CONFIG, DEFAULT_BYTEORDER, _check_byteorder, header_size, read_header, record_dtype
+from simatic_web_api import WebApiSession
+
+
+# Follow a test data file the PLC is still writing: poll its size with Files.Browse and fetch only
+# what was appended since the last poll, keeping the complete records in a local copy.
+#
+#     follower = TailFollower(api, "/UserFiles/Test-2012-01-01-031728_00001.bin", "local/Test-..._00001.bin")
+#     follower.follow(interval=5, on_records=lambda records: print(len(records)))
+#
+# The local copy is a valid data file at all times (header plus whole records), so DataFile,
+# DataStore and Pyramid can read it while it grows. The offset reached is saved in "<output>.follow.json"
+# after every poll, so a restarted follower continues where it stopped. Each poll downloads from the offset
+# with a Range request; if the PLC ignores the Range header the bytes before the offset are skipped
+# while streaming instead of being stored and decoded again. A partly written record at the end is
+# left for the next poll.
+class TailFollower:
+    def __init__(self, api, resource, output, byteorder=DEFAULT_BYTEORDER, config=CONFIG, log=print):
+        self.api = api
+        self.resource = resource
+        self.output = output
+        self.byteorder = _check_byteorder(byteorder)
+        self.config = config
+        self.dtype = record_dtype(self.byteorder, config)
+        self.log = log
+        self.header = None
+        self.offset = 0
+        self.size = 0
+        self.last_modified = None
+        self._load_state()
+
+    @property
+    def state_path(self):
+        return f"{self.output}.follow.json"
+
+    @property
+    def records(self):
+        return max(self.offset - header_size(self.config), 0) // self.dtype.itemsize
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = {}
+        if not os.path.exists(self.output):
+            return
+        if state.get("resource", self.resource) != self.resource:
+            self.reset()
+            return
+
+        # Records appended after the state was last saved are dropped and fetched again.
+        # Without a state file the local copy is trusted up to its last whole record.
+        whole = self._whole_records(os.path.getsize(self.output))
+        self.offset = min(state.get("offset", whole), whole)
+        self.size = state.get("size", 0)
+        self.last_modified = state.get("last_modified")
+        with open(self.output, "r+b") as file:
+            file.truncate(self.offset)
+            if self.offset >= header_size(self.config):
+                file.seek(0)
+                self.header = read_header(file.read(header_size(self.config)), self.byteorder, self.config)
+
+    def _save_state(self):
+        temp_path = f"{self.state_path}.part"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"resource": self.resource, "offset": self.offset, "size": self.size,
+                       "last_modified": self.last_modified}, file, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    # Bytes of a file of size bytes that form the header and whole records
+    def _whole_records(self, size):
+        if size < header_size(self.config):
+            return 0
+        return size - (size - header_size(self.config)) % self.dtype.itemsize
+
+    # Start over, e.g. when the PLC replaced the file with a shorter one
+    def reset(self):
+        self.header = None
+        self.offset = 0
+        if os.path.exists(self.output):
+            os.remove(self.output)
+
+    # Size and last_modified of the file on the PLC, or None if it is not listed
+    def _browse(self):
+        listing = self.api.browse_files(self.resource)
+        name = self.resource.rstrip("/").rsplit("/", 1)[-1]
+        for entry in (listing or {}).get("resources", []):
+            if entry.get("name") == name:
+                return entry.get("size"), entry.get("last_modified")
+        return None
+
+    # The last whole record of the local copy
+    def _last_record(self):
+        with open(self.output, "rb") as file:
+            file.seek(self.offset - self.dtype.itemsize)
+            return file.read(self.dtype.itemsize)
+
+    # Fetch and store what was appended since the last poll. Returns the new records as a structured
+    # array (empty if there were none), or None if the file could not be browsed or downloaded.
+    # The local copy is started over when the file on the PLC was replaced: it is shorter than before, it has
+    # the same size but another last_modified, it is older than before, or the last record already stored
+    # differs (each download starts one record before the offset to check this).
+    def poll(self):
+        entry = self._browse()
+        if entry is None:
+            self.log(f"{self.resource}: not found")
+            return None
+        size, last_modified = entry
+        if size < self.offset:
+            self.log(f"{self.resource}: file is shorter than before, starting over")
+            self.reset()
+        elif self.last_modified is not None and last_modified != self.last_modified and (
+                size == self.size or (last_modified or "") < self.last_modified):
+            self.log(f"{self.resource}: file was replaced, starting over")
+            self.reset()
+
+        end = self._whole_records(size)
+        if end <= self.offset:
+            self.size, self.last_modified = size, last_modified
+            return np.empty(0, dtype=self.dtype)
+
+        overlap = self.dtype.itemsize if self.offset > header_size(self.config) else 0
+        ticket_id = self.api.files_download(self.resource)
+        if not ticket_id:
+            return None
+        try:
+            data = self.api.download_bytes(ticket_id, offset=self.offset - overlap)
+        finally:
+            self.api.close_ticket(ticket_id)
+        if data is None:
+            return None
+        if overlap:
+            if bytes(data[:overlap]) != self._last_record():
+                self.log(f"{self.resource}: file was replaced, starting over")
+                self.reset()
+                return np.empty(0, dtype=self.dtype)
+            data = data[overlap:]
+
+        # The file may have grown or shrunk since it was browsed; keep whole records only
+        start = self.offset
+        end = self._whole_records(start + len(data))
+        if end <= start:
+            return np.empty(0, dtype=self.dtype)
+        data = data[:end - start]
+        with open(self.output, "ab") as file:
+            file.write(data)
+
+        self.offset = end
+        self.size, self.last_modified = size, last_modified
+        self._save_state()
+
+        if self.header is None:
+            self.header = read_header(data, self.byteorder, self.config)
+        first = max(header_size(self.config) - start, 0)
+        return np.frombuffer(data, dtype=self.dtype, offset=first)
+
+    # Poll every interval seconds until stop (a threading.Event) is set.
+    # on_records is called with the new records of every poll that found some; a failed poll is logged.
+    def follow(self, interval=5.0, on_records=None, stop=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            start_time = time.monotonic()
+            try:
+                records = self.poll()
+            except Exception as e:
+                self.log(f"{self.resource}: poll failed: {e}")
+                records = None
+            if records is not None and len(records):
+                self.log(f"{self.resource}: +{len(records)} records, {self.records} in total")
+                if on_records is not None:
+                    on_records(records)
+            stop.wait(max(0.0, interval - (time.monotonic() - start_time)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Follow a test data file while the PLC writes it.")
+    parser.add_argument("ip", help="PLC address")
+    parser.add_argument("resource", help="file on the PLC, e.g. /UserFiles/Test-2012-01-01-031728_00001.bin")
+    parser.add_argument("output", nargs="?", help="local copy (default: the file name in the current directory)")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default=os.environ.get("SIMATIC_PASSWORD", ""),
+                        help="password (default: SIMATIC_PASSWORD environment variable)")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between polls")
+    parser.add_argument("--byteorder", choices=("big", "little"), default="big", help="byte order of the file")
+    args = parser.parse_args(argv)
+
+    output = args.output or args.resource.rstrip("/").rsplit("/", 1)[-1]
+    with WebApiSession(args.ip, args.username, args.password, response_logging="off") as api:
+        if not api.login():
+            raise SystemExit("Login failed")
+        follower = TailFollower(api, args.resource, output, args.byteorder)
+        try:
+            follower.follow(args.interval)
+        except KeyboardInterrupt:
+            pass
+        print(f"{follower.records} records in {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from simatic_web_api import WebApiSession
+from api_metrics import ApiMetrics
+from transfer_journal import CLOSED, CREATED, FAILED, TRANSFERRED, TransferJournal, backoff_delays, sweep_tickets
+
+INDEX_NAME = "mirror_index.json"
+
+
+# Recursively list the files below a PLC directory. Yields (resource path, Files.Browse entry).
+def walk_files(api, root="/UserFiles"):
+    result = api.browse_files(root)
+    if not result:
+        return
+    for entry in result.get("resources", []):
+        path = f"{root.rstrip('/')}/{entry['name']}"
+        if entry.get("type") == "dir":
+            yield from walk_files(api, path)
+        elif entry.get("type") == "file":
+            yield path, entry
+
+
+# Local index of mirrored files: {resource path: {"size", "last_modified"}}
+def load_index(mirror_dir):
+    path = os.path.join(mirror_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_index(mirror_dir, index):
+    path = os.path.join(mirror_dir, INDEX_NAME)
+    with open(f"{path}.part", "w", encoding="utf-8") as file:
+        json.dump(index, file, indent=1, sort_keys=True)
+    os.replace(f"{path}.part", path)
+
+
+# Files that are new on the PLC or changed (grown) since they were mirrored
+def files_to_fetch(entries, index):
+    fetch = []
+    for resource, entry in entries:
+        known = index.get(resource)
+        if known is None or known["size"] != entry.get("size") or known["last_modified"] != entry.get("last_modified"):
+            fetch.append((resource, entry))
+    return fetch
+
+
+# Files that can be deleted from the PLC after mirroring: everything the index has with the current size
+# and last_modified (so files_to_fetch would not fetch it again), except the newest file of each directory,
+# which the PLC may still be writing to, and the failed resources of this run
+def files_to_rotate(entries, index, failed=()):
+    newest = {}
+    for resource, entry in entries:
+        directory = resource.rsplit("/", 1)[0]
+        if directory not in newest or entry.get("last_modified", "") > newest[directory][1].get("last_modified", ""):
+            newest[directory] = (resource, entry)
+    keep = {resource for resource, _ in newest.values()} | set(failed)
+    fetch = {resource for resource, _ in files_to_fetch(entries, index)}
+    return [resource for resource, _ in entries if resource not in keep and resource not in fetch]
+
+
+def _local_path(mirror_dir, resource):
+    return os.path.join(mirror_dir, *resource.strip("/").split("/"))
+
+
+# Mirror the files of one PLC into mirror_dir and return (fetched, failed, deleted) resource lists.
+# The index is saved after every group, so an interrupted mirror continues with the files still missing.
+#
+# workers:          downloads running at the same time on this PLC
+# max_open_tickets: Files.Download tickets opened (and closed) with one batch request per group
+# delete_after:     delete mirrored files from the PLC to free the user area (see files_to_rotate)
+# journal:          TransferJournal recording the tickets of each download; tickets an interrupted run
+#                   left open are closed first (see sweep_tickets)
+# retries:          attempts to download failed files again, after backoff_delays() between rounds
+def mirror_plc(api, mirror_dir, root="/UserFiles", workers=2, max_open_tickets=4, delete_after=False, log=print,
+               journal=None, retries=0):
+    os.makedirs(mirror_dir, exist_ok=True)
+    if journal is not None:
+        sweep_tickets(api, journal, log=lambda message: log(f"{api.ip}: {message}"))
+    index = load_index(mirror_dir)
+    entries = list(walk_files(api, root))
+    fetch = files_to_fetch(entries, index)
+    log(f"{api.ip}: {len(entries)} files, {len(fetch)} new or changed")
+
+    job = f"{api.ip}{root}"
+    fetched, failed = [], []
+    delays = backoff_delays(retries)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = fetch
+        while True:
+            failed = []
+            for start in range(0, len(pending), max_open_tickets):
+                group_fetched, group_failed = _mirror_group(api, mirror_dir, pending[start:start + max_open_tickets],
+                                                            index, executor, log, journal, job)
+                fetched += group_fetched
+                failed += group_failed
+                save_index(mirror_dir, index)
+
+            delay = next(delays, None)
+            if not failed or delay is None:
+                break
+            log(f"{api.ip}: retrying {len(failed)} files in {delay:.0f} s")
+            time.sleep(delay)
+            retry = set(failed)
+            pending = [(resource, entry) for resource, entry in pending if resource in retry]
+
+    if journal is not None and not failed:
+        journal.clear(job)
+
+    deleted = []
+    if delete_after:
+        rotate = files_to_rotate(entries, index, failed)
+        if rotate:
+            with api.batch() as batch:
+                for resource in rotate:
+                    api.files_delete(resource)
+            deleted = [call.body["params"]["resource"] for call in batch.calls if call.ok]
+            log(f"{api.ip}: deleted {len(deleted)} mirrored files")
+
+    return fetched, failed, deleted
+
+
+# Download one group of files: open their tickets in one batch, download, close them in one batch.
+# Returns (fetched, failed) resource lists and adds the fetched files to index.
+def _mirror_group(api, mirror_dir, group, index, executor, log, journal, job):
+    fetched, failed = [], []
+
+    def download(resource, entry, ticket_id):
+        path = _local_path(mirror_dir, resource)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = time.perf_counter()
+        result = api.download_file(ticket_id, path, expected_size=entry.get("size"))
+        return resource, entry, result, time.perf_counter() - start
+
+    with api.batch():
+        calls = [api.files_download(resource) for resource, _ in group]
+
+    futures = []
+    for (resource, entry), call in zip(group, calls):
+        if call.result:
+            if journal is not None:
+                journal.record(job, resource, CREATED, ticket_id=call.result, ticket_closed=False)
+            futures.append(executor.submit(download, resource, entry, call.result))
+        else:
+            log(f"{api.ip}: Files.Download failed for {resource}: {call.error}")
+            failed.append(resource)
+
+    for future in as_completed(futures):
+        resource, entry, result, seconds = future.result()
+        if result:
+            index[resource] = {"size": entry.get("size"), "last_modified": entry.get("last_modified")}
+            fetched.append(resource)
+            log(f"{api.ip}: {resource}: {entry.get('size')} bytes in {seconds:.2f} s")
+            if journal is not None:
+                journal.record(job, resource, TRANSFERRED, bytes=entry.get("size"))
+        else:
+            failed.append(resource)
+
+    opened = [(resource, call.result) for (resource, _), call in zip(group, calls) if call.result]
+    with api.batch():
+        closes = [api.close_ticket(ticket_id) for _, ticket_id in opened]
+    if journal is not None:
+        for (resource, _), close in zip(opened, closes):
+            step = FAILED if resource in failed else CLOSED
+            journal.record(job, resource, step, ticket_closed=close.ok)
+    return fetched, failed
+
+
+# Mirror many PLCs at once, one session per PLC.
+# targets: list of dicts with "ip", "username" and "password"; files go to mirror_root/<ip>/...
+# metrics: ApiMetrics shared by all sessions, to compare latency and throughput across PLCs
+# journal, retries: passed to mirror_plc; one TransferJournal can be shared by all PLCs
+def harvest_fleet(targets, mirror_root, root="/UserFiles", plc_workers=8, file_workers=2, delete_after=False, log=print,
+                  metrics=None, journal=None, retries=0):
+    def harvest(target):
+        mirror_dir = os.path.join(mirror_root, target["ip"].replace(":", "_"))
+        with WebApiSession(target["ip"], target["username"], target["password"], metrics=metrics) as api:
+            if not api.login():
+                raise RuntimeError("Login failed")
+            return mirror_plc(api, mirror_dir, root, file_workers, delete_after=delete_after, log=log,
+                              journal=journal, retries=retries)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=plc_workers) as executor:
+        futures = {executor.submit(harvest, target): target["ip"] for target in targets}
+        for future in as_completed(futures):
+            ip = futures[future]
+            try:
+                results[ip] = future.result()
+            except Exception as e:
+                log(f"{ip}: harvest failed: {e}")
+                results[ip] = None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mirror PLC user files to a local directory.")
+    parser.add_argument("mirror_root", help="local directory, one subdirectory per PLC")
+    parser.add_argument("--plc", action="append", required=True, help="PLC IP address, can be repeated")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default=os.environ.get("SIMATIC_PASSWORD", ""),
+                        help="password (default: SIMATIC_PASSWORD environment variable)")
+    parser.add_argument("--root", default="/UserFiles", help="PLC directory to mirror")
+    parser.add_argument("--plc-workers", type=int, default=8, help="PLCs harvested at the same time")
+    parser.add_argument("--file-workers", type=int, default=2, help="downloads at the same time per PLC")
+    parser.add_argument("--delete", action="store_true", help="delete mirrored files from the PLC, except the newest per directory")
+    parser.add_argument("--journal", help="record transfers in this file to resume and clean up after interruptions")
+    parser.add_argument("--retries", type=int, default=2, help="attempts to download failed files again")
+    parser.add_argument("--metrics", help="write request statistics to this file (.prom: Prometheus text, otherwise JSON)")
+    args = parser.parse_args(argv)
+
+    targets = [{"ip": ip, "username": args.username, "password": args.password} for ip in args.plc]
+    metrics = ApiMetrics() if args.metrics else None
+    journal = TransferJournal(args.journal) if args.journal else None
+    start_time = time.perf_counter()
+    try:
+        results = harvest_fleet(targets, args.mirror_root, args.root, args.plc_workers, args.file_workers, args.delete,
+                                metrics=metrics, journal=journal, retries=args.retries)
+    finally:
+        if journal is not None:
+            journal.close()
+    fetched = sum(len(result[0]) for result in results.values() if result)
+    print(f"Fetched {fetched} files from {len(targets)} PLCs in {time.perf_counter() - start_time:.2f} s")
+    if metrics is not None:
+        metrics.write(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
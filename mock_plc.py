@@ -0,0 +1,615 @@
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# JSON-RPC error codes returned by the mock, following the PLC where known
+ERRORS = {
+    2: "Permission denied",
+    4: "System is busy",
+    5: "Too many open tickets",
+    100: "Login failed",
+    -32600: "Invalid Request",
+    -32601: "Method not found",
+    -32602: "Invalid params",
+    1101: "Web application not found",
+    1102: "Web application already exists",
+    1103: "Resource not found",
+    1104: "Resource already exists",
+    1201: "File or directory not found",
+    1202: "Ticket not found",
+    200: "Address does not exist",
+    201: "Invalid value",
+}
+
+# JSON-RPC methods that do not need a token
+_PUBLIC_METHODS = ("Api.Login", "Api.Ping")
+
+
+class RpcError(Exception):
+    def __init__(self, code):
+        super().__init__(ERRORS[code])
+        self.code = code
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# Transfer ticket. Upload tickets store the posted data through on_upload, download tickets serve data.
+class MockTicket:
+    def __init__(self, provider, data=None, filename=None, on_upload=None):
+        self.id = uuid.uuid4().hex
+        self.provider = provider
+        self.data = data
+        self.filename = filename
+        self.on_upload = on_upload
+        self.date_created = _now()
+        self.state = "active"
+
+
+# In-memory state of a simulated S7-1500: users, sessions, web applications, user files and tickets.
+# All methods are thread-safe; the HTTP server calls them from one thread per connection.
+class MockPlc:
+    # users:            {username: password}
+    # max_open_tickets: tickets that may be open at the same time (the PLC rejects more)
+    # token_lifetime:   seconds a token stays valid without requests
+    # denied_methods:   methods rejected with "Permission denied" (code 2) even with a valid token
+    def __init__(self, users=None, max_open_tickets=8, token_lifetime=120, denied_methods=()):
+        self.users = users if users is not None else {"admin": "admin"}
+        self.max_open_tickets = max_open_tickets
+        self.token_lifetime = token_lifetime
+        self.denied_methods = set(denied_methods)
+        self.ping_id = uuid.uuid4().hex
+        self.tokens = {}
+        self.apps = {}
+        self.files = {}
+        self.tickets = {}
+        self.tags = {}
+        self.calls = 0
+        self._lock = threading.RLock()
+        self._methods = {
+            "Api.Login": self._api_login,
+            "Api.Logout": self._api_logout,
+            "Api.Ping": lambda params, token: self.ping_id,
+            "Api.BrowseTickets": self._api_browse_tickets,
+            "Api.CloseTicket": self._api_close_ticket,
+            "WebApp.Create": self._web_app_create,
+            "WebApp.Delete": self._web_app_delete,
+            "WebApp.Browse": self._web_app_browse,
+            "WebApp.Rename": self._web_app_rename,
+            "WebApp.SetDefaultPage": self._web_app_set_default_page,
+            "WebApp.CreateResource": self._web_app_create_resource,
+            "WebApp.DeleteResource": self._web_app_delete_resource,
+            "WebApp.DownloadResource": self._web_app_download_resource,
+            "WebApp.BrowseResources": self._web_app_browse_resources,
+            "Files.Browse": self._files_browse,
+            "Files.Download": self._files_download,
+            "Files.Delete": self._files_delete,
+            "Files.Create": self._files_create,
+            "PlcProgram.Browse": self._plc_program_browse,
+            "PlcProgram.Read": self._plc_program_read,
+            "PlcProgram.Write": self._plc_program_write,
+        }
+
+    # Simulate a PLC restart: all sessions and tickets are dropped and the ping id changes
+    def restart(self):
+        with self._lock:
+            self.ping_id = uuid.uuid4().hex
+            self.tokens = {}
+            self.tickets = {}
+
+    # Store a file in the user area, e.g. to prepare data for download tests
+    def add_file(self, resource, data, last_modified=None):
+        with self._lock:
+            self.files[resource] = {"data": bytes(data), "last_modified": last_modified or _now()}
+
+    # Define a tag for PlcProgram.*, e.g. add_tag('"Data".flow', "Real", 1.5)
+    def add_tag(self, name, datatype, value):
+        with self._lock:
+            self.tags[name] = {"datatype": datatype, "value": value}
+
+    # Append to a file in the user area, like the PLC writing a test file
+    def append_file(self, resource, data, last_modified=None):
+        with self._lock:
+            previous = self.files.get(resource, {}).get("data", b"")
+            self.files[resource] = {"data": previous + bytes(data), "last_modified": last_modified or _now()}
+
+    # Answer one JSON-RPC request object (or a batch array) like the PLC does
+    def handle(self, body, token):
+        if isinstance(body, list):
+            if not body:
+                return self._error(None, -32600)
+            return [self._handle_one(item, token) for item in body]
+        return self._handle_one(body, token)
+
+    @staticmethod
+    def _error(request_id, code):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": ERRORS[code]}}
+
+    def _handle_one(self, body, token):
+        if not isinstance(body, dict) or "method" not in body:
+            return self._error(None, -32600)
+        request_id = body.get("id")
+        method = self._methods.get(body["method"])
+        if method is None:
+            return self._error(request_id, -32601)
+        with self._lock:
+            self.calls += 1
+            try:
+                if body["method"] not in _PUBLIC_METHODS:
+                    self._check_token(token)
+                if body["method"] in self.denied_methods:
+                    raise RpcError(2)
+                result = method(body.get("params") or {}, token)
+            except RpcError as e:
+                return self._error(request_id, e.code)
+            except KeyError:
+                return self._error(request_id, -32602)
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def _check_token(self, token):
+        expires = self.tokens.get(token)
+        if expires is None or expires < time.monotonic():
+            self.tokens.pop(token, None)
+            raise RpcError(2)
+        self.tokens[token] = time.monotonic() + self.token_lifetime
+
+    def _open_ticket(self, provider, **kwargs):
+        if len(self.tickets) >= self.max_open_tickets:
+            raise RpcError(5)
+        ticket = MockTicket(provider, **kwargs)
+        self.tickets[ticket.id] = ticket
+        return ticket.id
+
+    def ticket(self, ticket_id):
+        with self._lock:
+            return self.tickets.get(ticket_id)
+
+    def _api_login(self, params, token):
+        if self.users.get(params["user"]) != params["password"]:
+            raise RpcError(100)
+        token = uuid.uuid4().hex
+        self.tokens[token] = time.monotonic() + self.token_lifetime
+        return {"token": token}
+
+    def _api_logout(self, params, token):
+        self.tokens.pop(token, None)
+        return True
+
+    def _api_browse_tickets(self, params, token):
+        tickets = [{"id": ticket.id, "date_created": ticket.date_created, "provider": ticket.provider,
+                    "state": ticket.state} for ticket in self.tickets.values()]
+        return {"max_tickets": self.max_open_tickets, "tickets": tickets}
+
+    def _api_close_ticket(self, params, token):
+        if self.tickets.pop(params["id"], None) is None:
+            raise RpcError(1202)
+        return True
+
+    def _app(self, name):
+        if name not in self.apps:
+            raise RpcError(1101)
+        return self.apps[name]
+
+    def _web_app_create(self, params, token):
+        if params["name"] in self.apps:
+            raise RpcError(1102)
+        self.apps[params["name"]] = {"state": params.get("state", "enabled"), "default_page": None, "resources": {}}
+        return True
+
+    def _web_app_delete(self, params, token):
+        self._app(params["name"])
+        del self.apps[params["name"]]
+        return True
+
+    def _web_app_browse(self, params, token):
+        names = [params["name"]] if "name" in params else sorted(self.apps)
+        applications = []
+        for name in names:
+            app = self._app(name)
+            entry = {"name": name, "state": app["state"], "type": "user"}
+            if app["default_page"]:
+                entry["default_page"] = app["default_page"]
+            applications.append(entry)
+        return {"applications": applications}
+
+    def _web_app_rename(self, params, token):
+        self._app(params["name"])
+        if params["new_name"] in self.apps:
+            raise RpcError(1102)
+        self.apps[params["new_name"]] = self.apps.pop(params["name"])
+        return True
+
+    def _web_app_set_default_page(self, params, token):
+        self._app(params["name"])["default_page"] = params["resource_name"] or None
+        return True
+
+    def _web_app_create_resource(self, params, token):
+        resources = self._app(params["app_name"])["resources"]
+        name = params["name"]
+        if name in resources:
+            raise RpcError(1104)
+        entry = {
+            "name": name,
+            "size": 0,
+            "media_type": params["media_type"],
+            "last_modified": params.get("last_modified") or _now(),
+            "visibility": params.get("visibility", "public"),
+            "data": b""
+        }
+
+        def store(data):
+            with self._lock:
+                entry["data"] = data
+                entry["size"] = len(data)
+                entry["etag"] = uuid.uuid4().hex[:16]
+
+        ticket_id = self._open_ticket("WebApp.CreateResource", on_upload=store)
+        resources[name] = entry
+        return ticket_id
+
+    def _resource(self, params):
+        resources = self._app(params["app_name"])["resources"]
+        if params["name"] not in resources:
+            raise RpcError(1103)
+        return resources[params["name"]]
+
+    def _web_app_delete_resource(self, params, token):
+        del self._app(params["app_name"])["resources"][self._resource(params)["name"]]
+        return True
+
+    def _web_app_download_resource(self, params, token):
+        resource = self._resource(params)
+        return self._open_ticket("WebApp.DownloadResource", data=resource["data"], filename=resource["name"])
+
+    def _web_app_browse_resources(self, params, token):
+        resources = self._app(params["app_name"])["resources"]
+        names = [params["name"]] if "name" in params else sorted(resources)
+        return {"resources": [{key: value for key, value in self._resource({**params, "name": name}).items()
+                               if key != "data"} for name in names]}
+
+    def _files_browse(self, params, token):
+        resource = params["resource"].rstrip("/") or "/"
+        if resource in self.files:
+            entry = self.files[resource]
+            return {"resources": [self._file_entry(resource.rsplit("/", 1)[-1], entry)]}
+
+        prefix = resource.rstrip("/") + "/"
+        children = {}
+        for path, entry in self.files.items():
+            if path.startswith(prefix):
+                name, _, rest = path[len(prefix):].partition("/")
+                if rest:
+                    children.setdefault(name, {"name": name, "type": "dir", "last_modified": entry["last_modified"]})
+                else:
+                    children[name] = self._file_entry(name, entry)
+        if not children and resource not in ("/", "/UserFiles"):
+            raise RpcError(1201)
+        return {"resources": [children[name] for name in sorted(children)]}
+
+    @staticmethod
+    def _file_entry(name, entry):
+        return {"name": name, "type": "file", "size": len(entry["data"]), "last_modified": entry["last_modified"],
+                "state": "active"}
+
+    def _files_download(self, params, token):
+        resource = params["resource"]
+        if resource not in self.files:
+            raise RpcError(1201)
+        return self._open_ticket("Files.Download", data=self.files[resource]["data"],
+                                 filename=resource.rsplit("/", 1)[-1])
+
+    def _files_delete(self, params, token):
+        if self.files.pop(params["resource"], None) is None:
+            raise RpcError(1201)
+        return True
+
+    def _files_create(self, params, token):
+        resource = params["resource"]
+        return self._open_ticket("Files.Create", on_upload=lambda data: self.add_file(resource, data))
+
+
+    # Tags are stored flat by their full name; structures are the prefixes before a "."
+    def _plc_program_browse(self, params, token):
+        var = params.get("var")
+        if params.get("mode", "children") == "var":
+            if var in self.tags:
+                return [self._tag_entry(var, self.tags[var]["datatype"], False)]
+            if any(name.startswith(f"{var}.") for name in self.tags):
+                return [self._tag_entry(var, "Struct", True)]
+            raise RpcError(200)
+
+        prefix = f"{var}." if var else ""
+        children = {}
+        for name, tag in self.tags.items():
+            if name.startswith(prefix):
+                child, dot, _ = name[len(prefix):].partition(".")
+                children[child] = ("Struct", True) if dot else (tag["datatype"], False)
+        if not children:
+            raise RpcError(200)
+        return [self._tag_entry(f"{prefix}{child}", *children[child]) for child in sorted(children)]
+
+    @staticmethod
+    def _tag_entry(name, datatype, has_children):
+        return {"name": name.rsplit(".", 1)[-1].strip('"'), "datatype": datatype, "has_children": has_children}
+
+    def _tag(self, params):
+        if params["var"] not in self.tags:
+            raise RpcError(200)
+        return self.tags[params["var"]]
+
+    def _plc_program_read(self, params, token):
+        return self._tag(params)["value"]
+
+    def _plc_program_write(self, params, token):
+        tag = self._tag(params)
+        value = params["value"]
+        if isinstance(value, bool) != (tag["datatype"].lower() == "bool"):
+            raise RpcError(201)
+        tag["value"] = value
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockPLC"
+    CHUNK_SIZE = 64 * 1024
+
+    # The TLS handshake runs here, in the connection's thread, with the configured extra cost
+    def setup(self):
+        server = self.server.mock
+        with server._lock:
+            server.connections += 1
+        if server.handshake_delay:
+            time.sleep(server.handshake_delay)
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self._write(body)
+
+    # Write (or read) in chunks, sleeping as needed to stay below the bandwidth limit
+    def _throttle(self, start_time, transferred):
+        bandwidth = self.server.mock.bandwidth
+        if bandwidth:
+            delay = transferred / bandwidth - (time.perf_counter() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _write(self, data):
+        start_time = time.perf_counter()
+        view = memoryview(data)
+        for position in range(0, len(view), self.CHUNK_SIZE):
+            chunk = view[position:position + self.CHUNK_SIZE]
+            self.wfile.write(chunk)
+            self._throttle(start_time, position + len(chunk))
+
+    # Request body, or None if the client disconnected before sending all of it
+    def _read_body(self):
+        start_time = time.perf_counter()
+        parts = []
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+                received += size
+                self._throttle(start_time, received)
+        else:
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining:
+                chunk = self.rfile.read(min(remaining, self.CHUNK_SIZE))
+                if not chunk:
+                    return None
+                parts.append(chunk)
+                remaining -= len(chunk)
+                received += len(chunk)
+                self._throttle(start_time, received)
+        return b"".join(parts)
+
+    def _ticket(self):
+        ticket_id = parse_qs(urlparse(self.path).query).get("id", [None])[0]
+        return self.server.mock.plc.ticket(ticket_id)
+
+    def do_POST(self):
+        mock = self.server.mock
+        path = urlparse(self.path).path
+        try:
+            body = self._read_body()
+        except (OSError, ValueError):
+            body = None
+        if body is None:
+            self.close_connection = True
+            return
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if path == "/api/jsonrpc":
+            with mock._lock:
+                mock.rpc_requests += 1
+            try:
+                request = json.loads(body)
+            except ValueError:
+                response = {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}}
+            else:
+                response = mock.plc.handle(request, self.headers.get("X-Auth-Token"))
+            self._send(200, json.dumps(response).encode())
+        elif path == "/api/ticket":
+            with mock._lock:
+                mock.ticket_requests += 1
+            ticket = self._ticket()
+            if ticket is None or ticket.on_upload is None:
+                self._send(404, b"Ticket not found", "text/plain")
+                return
+            ticket.on_upload(body)
+            ticket.state = "completed"
+            self._send(200)
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+    def do_GET(self):
+        mock = self.server.mock
+        if mock.latency:
+            time.sleep(mock.latency)
+        if urlparse(self.path).path != "/api/ticket":
+            self._send(404, b"Not found", "text/plain")
+            return
+        with mock._lock:
+            mock.ticket_requests += 1
+        ticket = self._ticket()
+        if ticket is None or ticket.data is None:
+            self._send(404, b"Ticket not found", "text/plain")
+            return
+        ticket.state = "completed"
+        headers = [("Content-Disposition", f'attachment; filename="{ticket.filename}"')]
+        offset = self._range_start(len(ticket.data)) if mock.range_requests else None
+        if offset is None:
+            status, data = 200, ticket.data
+        else:
+            status, data = 206, ticket.data[offset:]
+            headers.append(("Content-Range", f"bytes {offset}-{len(ticket.data) - 1}/{len(ticket.data)}"))
+        with mock._lock:
+            mock.ticket_bytes += len(data)
+        self._send(status, data, "application/octet-stream", headers)
+
+    # Start of an open-ended "Range: bytes=<start>-" header, None without one (or an unsupported one)
+    def _range_start(self, size):
+        value = self.headers.get("Range", "")
+        if not value.startswith("bytes=") or not value.endswith("-"):
+            return None
+        try:
+            start = int(value[len("bytes="):-1])
+        except ValueError:
+            return None
+        return min(start, size)
+
+
+# Self-signed certificate for the mock server, created with the openssl command line tool.
+# Returns (certfile, keyfile).
+def generate_certificate(directory, common_name="localhost"):
+    certfile = os.path.join(directory, "mock_plc.crt")
+    keyfile = os.path.join(directory, "mock_plc.key")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", f"/CN={common_name}", "-keyout", keyfile, "-out", certfile],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Creating a certificate with openssl failed: {e}")
+    return certfile, keyfile
+
+
+# HTTPS server in a background thread serving a MockPlc on /api/jsonrpc and /api/ticket:
+#
+#     with MockPlcServer(latency=0.005, bandwidth=2_000_000) as server:
+#         api = WebApiSession(server.address, "admin", "admin")
+#
+# latency:          seconds added to every request (PLC processing time)
+# handshake_delay:  seconds added to every new connection (TLS handshake on the PLC CPU)
+# bandwidth:        bytes per second for request and response bodies, None for unlimited
+# certfile/keyfile: certificate to serve, a self-signed one is generated if not given
+# range_requests:   answer "Range: bytes=<start>-" ticket downloads with 206 and the rest of the file;
+#                   off by default, the PLC is not known to support it
+class MockPlcServer:
+    def __init__(self, plc=None, host="127.0.0.1", port=0, latency=0.0, handshake_delay=0.0, bandwidth=None,
+                 certfile=None, keyfile=None, range_requests=False):
+        self.plc = plc or MockPlc()
+        self.latency = latency
+        self.handshake_delay = handshake_delay
+        self.bandwidth = bandwidth
+        self.range_requests = range_requests
+        self.connections = 0
+        self.rpc_requests = 0
+        self.ticket_requests = 0
+        self.ticket_bytes = 0
+        self._lock = threading.Lock()
+        self._temp_dir = None
+        if certfile is None:
+            self._temp_dir = tempfile.TemporaryDirectory()
+            certfile, keyfile = generate_certificate(self._temp_dir.name)
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.socket = context.wrap_socket(self._server.socket, server_side=True, do_handshake_on_connect=False)
+        self._server.mock = self
+        self._thread = None
+
+    # "host:port", usable as the ip argument of WebApiSession
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a mock S7-1500 Web API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--handshake-delay", type=float, default=0.0, help="seconds added to every new connection")
+    parser.add_argument("--bandwidth", type=float, default=None, help="transfer limit in bytes per second")
+    parser.add_argument("--max-open-tickets", type=int, default=8)
+    parser.add_argument("--certfile", help="certificate to serve (default: generate a self-signed one)")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--range-requests", action="store_true", help="support Range headers on ticket downloads")
+    args = parser.parse_args(argv)
+
+    plc = MockPlc({args.username: args.password}, args.max_open_tickets)
+    server = MockPlcServer(plc, args.host, args.port, args.latency, args.handshake_delay, args.bandwidth,
+                           args.certfile, args.keyfile, args.range_requests)
+    print(f"Mock PLC listening on https://{server.address}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import os
+import numpy as np
+
+
+# Layout of the PLC test data file (see other/data_file.txt). Same field table as "config" in
+# web_files/binaryDownloader.js, keep the two in sync.
+CONFIG = {
+    "metadata": [
+        {"name": "Identifier", "type": "string", "length": 34, "unit": ""},
+        {"name": "TestName", "type": "string", "length": 66, "unit": ""},
+        {"name": "TestOperator", "type": "string", "length": 34, "unit": ""},
+        {"name": "FileNumber", "type": "int32", "length": 4, "unit": ""},
+        {"name": "StartTime", "type": "datetime64", "length": 8, "unit": "ISO8601"},
+        {"name": "SamplingInterval", "type": "int32", "length": 4, "unit": "ms"},
+    ],
+    "record": [
+        {"name": "Flow", "type": "float32", "length": 4, "unit": "lmin"},
+        {"name": "PressureIn", "type": "float32", "length": 4, "unit": "bar"},
+        {"name": "PressureOut", "type": "float32", "length": 4, "unit": "bar"},
+        {"name": "TemperatureIn", "type": "float32", "length": 4, "unit": "C"},
+        {"name": "TemperatureOut", "type": "float32", "length": 4, "unit": "C"},
+        {"name": "Vibration", "type": "float32", "length": 4, "unit": "g"},
+        {"name": "Energy", "type": "float32", "length": 4, "unit": "J"},
+        {
+            "name": "BinaryStates",
+            "type": "uint32",
+            "length": 4,
+            # Most significant bit first
+            "bits": [f"RSV_X{bit}" for bit in range(31, -1, -1)],
+        },
+    ],
+}
+
+# Byte order of numbers in the file. other/data_file.txt says little-endian, but the PLC writes
+# big-endian (S7 native) and binaryDownloader.js decodes big-endian, so that is the default.
+BIG_ENDIAN = ">"
+LITTLE_ENDIAN = "<"
+DEFAULT_BYTEORDER = BIG_ENDIAN
+
+_NUMPY_TYPES = {
+    "int32": "i4",
+    "uint32": "u4",
+    "float32": "f4",
+    "datetime64": "u8",
+}
+
+
+def _check_byteorder(byteorder):
+    if byteorder in ("big", "little"):
+        byteorder = BIG_ENDIAN if byteorder == "big" else LITTLE_ENDIAN
+    if byteorder not in (BIG_ENDIAN, LITTLE_ENDIAN):
+        raise ValueError(f"Invalid byte order: {byteorder!r}")
+    return byteorder
+
+
+# Column name used in CSV/JSON output, e.g. "Flow_lmin" (same as binaryDownloader.js)
+def field_key(field):
+    return f"{field['name']}_{field['unit']}" if field.get("unit") else field["name"]
+
+
+def header_size(config=CONFIG):
+    return sum(field["length"] for field in config["metadata"])
+
+
+def record_size(config=CONFIG):
+    return sum(field["length"] for field in config["record"])
+
+
+# NumPy structured dtype of one record
+def record_dtype(byteorder=DEFAULT_BYTEORDER, config=CONFIG):
+    byteorder = _check_byteorder(byteorder)
+    return np.dtype([(field["name"], byteorder + _NUMPY_TYPES[field["type"]]) for field in config["record"]])
+
+
+def bit_names(config=CONFIG):
+    for field in config["record"]:
+        if field.get("bits"):
+            return field["bits"]
+    return []
+
+
+def _decode_string(raw):
+    used = min(raw[1], len(raw) - 2)
+    return raw[2:2 + used].decode("utf-8", errors="replace").replace("\0", "").strip()
+
+
+# Decode the metadata header from the start of a buffer. Keys are the field names;
+# StartTime is a numpy.datetime64 with nanosecond resolution.
+def read_header(buffer, byteorder=DEFAULT_BYTEORDER, config=CONFIG):
+    byteorder = _check_byteorder(byteorder)
+    raw = bytes(memoryview(buffer)[:header_size(config)])
+    if len(raw) < header_size(config):
+        raise ValueError(f"File is shorter than the {header_size(config)} byte header")
+
+    header = {}
+    offset = 0
+    for field in config["metadata"]:
+        chunk = raw[offset:offset + field["length"]]
+        if field["type"] == "string":
+            value = _decode_string(chunk)
+        elif field["type"] == "datetime64":
+            nanoseconds = int(np.frombuffer(chunk, byteorder + "u8")[0])
+            value = np.datetime64(nanoseconds, "ns")
+        else:
+            value = int(np.frombuffer(chunk, byteorder + _NUMPY_TYPES[field["type"]])[0])
+        header[field["name"]] = value
+        offset += field["length"]
+    return header
+
+
+# Unpack a uint32 state array into a (records, 32) boolean array, column 0 = most significant bit
+def unpack_states(states):
+    states = np.ascontiguousarray(states, dtype=">u4")
+    return np.unpackbits(states.view(np.uint8).reshape(-1, 4), axis=1).astype(bool)
+
+
+# Decoded view of a test data file. The records are a structured array mapped over the file
+# (or over an in-memory buffer), so nothing is decoded until a field is accessed.
+class DataFile:
+    def __init__(self, header, records, byteorder=DEFAULT_BYTEORDER, config=CONFIG, path=None):
+        self.header = header
+        self.records = records
+        self.byteorder = byteorder
+        self.config = config
+        self.path = path
+
+    # Memory-map a file on disk
+    @classmethod
+    def open(cls, path, byteorder=DEFAULT_BYTEORDER, config=CONFIG):
+        byteorder = _check_byteorder(byteorder)
+        with open(path, "rb") as file:
+            header = read_header(file.read(header_size(config)), byteorder, config)
+        dtype = record_dtype(byteorder, config)
+        count = (os.path.getsize(path) - header_size(config)) // dtype.itemsize
+        if count > 0:
+            records = np.memmap(path, dtype=dtype, mode="r", offset=header_size(config), shape=(count,))
+        else:
+            records = np.empty(0, dtype=dtype)
+        return cls(header, records, byteorder, config, path)
+
+    # Decode an in-memory buffer, e.g. the memoryview returned by WebApiSession.download_bytes()
+    @classmethod
+    def from_buffer(cls, buffer, byteorder=DEFAULT_BYTEORDER, config=CONFIG):
+        byteorder = _check_byteorder(byteorder)
+        header = read_header(buffer, byteorder, config)
+        dtype = record_dtype(byteorder, config)
+        count = (len(memoryview(buffer).cast("B")) - header_size(config)) // dtype.itemsize
+        records = np.frombuffer(buffer, dtype=dtype, count=max(count, 0), offset=header_size(config))
+        return cls(header, records, byteorder, config)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def field_names(self):
+        return [field["name"] for field in self.config["record"]]
+
+    @property
+    def bit_names(self):
+        return bit_names(self.config)
+
+    # One field as a native-endian array
+    def field(self, name):
+        return self.records[name].astype(self.records.dtype[name].newbyteorder("="), copy=False)
+
+    # All bits of BinaryStates as a (records, 32) boolean array, columns in bit_names order
+    def states(self):
+        return unpack_states(self.records["BinaryStates"])
+
+    # A single named bit of BinaryStates
+    def bit(self, name):
+        shift = 31 - self.bit_names.index(name)
+        return ((self.field("BinaryStates") >> np.uint32(shift)) & 1).astype(bool)
+
+    # Record timestamps derived from StartTime and SamplingInterval
+    def timestamps(self, start=0, stop=None):
+        stop = len(self) if stop is None else stop
+        interval = np.timedelta64(self.header["SamplingInterval"], "ms")
+        return self.header["StartTime"] + np.arange(start, stop) * interval
+
+    # Drop the memory map; it is unmapped once no arrays taken from it are left
+    def close(self):
+        self.records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
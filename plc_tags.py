@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger("simatic_web_api")
+
+# NumPy types of the PLC elementary data types (as named by PlcProgram.Browse). Other types
+# (strings, structures, date and time types) are kept as Python objects.
+DATATYPES = {
+    "bool": "?",
+    "byte": "u1",
+    "usint": "u1",
+    "sint": "i1",
+    "word": "u2",
+    "uint": "u2",
+    "int": "i2",
+    "dword": "u4",
+    "udint": "u4",
+    "dint": "i4",
+    "lword": "u8",
+    "ulint": "u8",
+    "lint": "i8",
+    "real": "f4",
+    "lreal": "f8",
+    "time": "i4",
+    "ltime": "i8",
+}
+
+
+# NumPy dtype of a PLC data type, object for types without a fixed-size representation
+def tag_dtype(datatype):
+    return np.dtype(DATATYPES.get(str(datatype).lower(), object))
+
+
+# Thread-safe cache with a time to live and least-recently-used eviction
+class TtlLruCache:
+    # max_entries: entries kept; the least recently used one is dropped when full
+    # ttl:         seconds an entry stays valid, None to keep it until evicted
+    def __init__(self, max_entries=1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Cached value, or default if it is missing or expired
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.monotonic()):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Drop one entry, or all entries if key is not given
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def _json_value(value):
+    return value.tolist() if hasattr(value, "tolist") else value
+
+
+# Typed access to PLC tags through PlcProgram.Read/Write/Browse of a WebApiSession.
+# Reads and writes of many tags are sent as one JSON-RPC batch, browse results and tag metadata
+# are cached, so polling the same tags again costs one request.
+#
+#     tags = PlcTags(api)
+#     values, valid = tags.read_array(['"Data".flow', '"Data".pressure', '"Data".running'])
+#
+# cache:     TtlLruCache for browse results and metadata, can be shared by several PlcTags of one PLC
+# max_calls: calls per batch request; the PLC limits the size of a request, so very long tag lists are split
+class PlcTags:
+    def __init__(self, api, cache=None, max_calls=200):
+        self.api = api
+        self.cache = cache if cache is not None else TtlLruCache()
+        self.max_calls = max_calls
+
+    # Members of a data block or structure ({"name", "datatype", "has_children", ...}), or the
+    # data blocks if var is not given. None if browsing failed.
+    def browse(self, var=None):
+        key = (self.api.ip, "children", var)
+        children = self.cache.get(key)
+        if children is None:
+            children = self.api.plc_program_browse(var)
+            if children is None:
+                return None
+            self.cache.put(key, children)
+        return children
+
+    # Browse metadata of tags ({"name", "datatype", ...}), fetching the ones not cached in one batch.
+    # Returns {tag: metadata}, tags that could not be browsed are missing.
+    def metadata(self, tags):
+        found = {}
+        missing = []
+        for tag in dict.fromkeys(tags):
+            entry = self.cache.get((self.api.ip, "var", tag))
+            if entry is None:
+                missing.append(tag)
+            else:
+                found[tag] = entry
+
+        if missing:
+            with self.api.batch(self.max_calls):
+                calls = [self.api.plc_program_browse(tag, mode="var") for tag in missing]
+            for tag, call in zip(missing, calls):
+                if call.result:
+                    found[tag] = call.result[0]
+                    self.cache.put((self.api.ip, "var", tag), call.result[0])
+                else:
+                    logger.warning("Browsing %s failed: %s", tag, call.error)
+        return found
+
+    # NumPy dtypes of tags: object for non-numeric and array tags, None for tags that could not be browsed
+    def dtypes(self, tags):
+        metadata = self.metadata(tags)
+        dtypes = []
+        for tag in tags:
+            if tag not in metadata:
+                dtypes.append(None)
+            elif metadata[tag].get("array_dimensions"):
+                dtypes.append(np.dtype(object))
+            else:
+                dtypes.append(tag_dtype(metadata[tag]["datatype"]))
+        return dtypes
+
+    # Read tags with one batch request. Returns {tag: value}, None for tags that could not be read.
+    def read(self, tags):
+        tags = list(tags)
+        with self.api.batch(self.max_calls):
+            calls = [self.api.plc_program_read(tag) for tag in tags]
+        failed = [(tag, call.error) for tag, call in zip(tags, calls) if not call.ok]
+        if failed:
+            logger.warning("Reading %d of %d tags failed, first: %s: %s", len(failed), len(tags), *failed[0])
+        return {tag: call.result if call.ok else None for tag, call in zip(tags, calls)}
+
+    # Read tags into one array, typed from the tag metadata: the smallest type that holds every tag's value
+    # (np.result_type, e.g. float32 for Int and Real tags, float64 for DInt and Real tags).
+    # Returns (values, valid): tags that could not be read are 0 in values and False in valid.
+    def read_array(self, tags, dtype=None):
+        tags = list(tags)
+        if dtype is None:
+            dtypes = [dtype for dtype in self.dtypes(tags) if dtype is not None]
+            dtype = np.result_type(*dtypes) if dtypes else np.dtype("f8")
+        values = self.read(tags)
+        valid = np.array([values[tag] is not None for tag in tags], dtype=bool)
+        array = np.zeros(len(tags), dtype=dtype)
+        for i, tag in enumerate(tags):
+            if valid[i]:
+                array[i] = values[tag]
+        return array, valid
+
+    # Write tags ({tag: value}) with one batch request. NumPy values are converted to JSON.
+    # Returns {tag: True/False}.
+    def write(self, values):
+        items = list(values.items())
+        with self.api.batch(self.max_calls):
+            calls = [self.api.plc_program_write(tag, _json_value(value)) for tag, value in items]
+        for (tag, _), call in zip(items, calls):
+            if not call.ok:
+                logger.warning("Writing %s failed: %s", tag, call.error)
+        return {tag: call.ok for (tag, _), call in zip(items, calls)}
+
+    # Forget cached browse results and metadata, e.g. after a program download changed the data blocks
+    def invalidate(self):
+        self.cache.invalidate()
@@ -1,274 +1,280 @@
 import requests
 import urllib3
-from datetime import datetime
+import logging
+import contextvars
+import threading
+from datetime import datetime, timezone
 import re
 import mimetypes
 import json
 import os
+import io
+import time
+from api_metrics import RPC, BATCH, UPLOAD, DOWNLOAD
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+logger = logging.getLogger("simatic_web_api")
 
-class WebApiSession:
-    def __init__(self, ip, username, password):
+# Values for the response_logging option:
+# "off":     nothing is logged for successful calls
+# "summary": one INFO line per call with the method, HTTP status and JSON-RPC error (if any)
+# "full":    request and response bodies as indented JSON
+RESPONSE_LOGGING = ("off", "summary", "full")
+
+
+# JSON-RPC error codes returned when the token is missing, invalid or expired
+AUTH_ERROR_CODES = (2,)
+
+# Methods that are never replayed after logging in again
+_NO_RELOGIN_METHODS = ("Api.Login", "Api.Logout", "Api.Ping")
+
+
+def _is_auth_error(body, json_response):
+    error = json_response.get("error") if isinstance(json_response, dict) else None
+    return bool(error) and error.get("code") in AUTH_ERROR_CODES and body["method"] not in _NO_RELOGIN_METHODS
+
+
+# Response extractors used by the JSON-RPC methods
+def _result(json_response):
+    return json_response.get("result")
+
+
+def _result_or_empty(json_response):
+    return json_response.get("result", {})
+
+
+def _result_tickets(json_response):
+    return json_response.get("result", {}).get("tickets")
+
+
+# Progress callback for command line scripts: prints bytes transferred and throughput on one line
+def print_progress(transferred, total, elapsed):
+    percent = 100 * transferred / total if total else 100
+    rate = transferred / elapsed / 1024 if elapsed else 0
+    end = "\n" if transferred >= total else ""
+    print(f"\r{transferred}/{total} bytes ({percent:.0f} %) {rate:.1f} kB/s", end=end, flush=True)
+
+
+# Request body that streams an upload source in chunks with a known length, reporting progress.
+# Paths are read from disk chunk by chunk and buffers are sent as memoryview slices without copying.
+class UploadStream:
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, source, progress=None, chunk_size=CHUNK_SIZE):
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.sent = 0
+        self._buffer = None
+        self._file = None
+        self._owns_file = False
+
+        if isinstance(source, (str, os.PathLike)):
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"File '{source}' does not exist.")
+            self._file = open(source, "rb")
+            self._owns_file = True
+        elif hasattr(source, "read"):
+            self._file = source
+        else:
+            self._buffer = memoryview(source).cast("B")
+
+        if self._file is not None:
+            start = self._file.tell()
+            self.total = self._file.seek(0, io.SEEK_END) - start
+            self._file.seek(start)
+        else:
+            self.total = len(self._buffer)
+        self._start_time = time.perf_counter()
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def is_file(self):
+        return self._file is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.total - self.sent
+        size = min(size, self.chunk_size, self.total - self.sent)
+        if self._buffer is not None:
+            chunk = self._buffer[self.sent:self.sent + size]
+        else:
+            chunk = self._file.read(size)
+        self.sent += len(chunk)
+        if self.progress and len(chunk):
+            self.progress(self.sent, self.total, time.perf_counter() - self._start_time)
+        return chunk
+
+    # Generator over the chunks, for clients that take an iterable body
+    def chunks(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not len(chunk):
+                break
+            yield chunk
+
+
+# Log message arguments that are only formatted when a record is actually emitted
+class _JsonText:
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self._redact(self.value), indent=4, default=str)
+
+    # Hide login passwords from full request logs
+    @classmethod
+    def _redact(cls, value):
+        if isinstance(value, list):
+            return [cls._redact(item) for item in value]
+        if isinstance(value, dict):
+            return {key: "***" if key == "password" else cls._redact(item) for key, item in value.items()}
+        return value
+
+
+class _Summary:
+    def __init__(self, body, json_response):
+        self.body = body
+        self.json_response = json_response
+
+    def __str__(self):
+        if isinstance(self.body, list):
+            responses = self.json_response if isinstance(self.json_response, list) else []
+            errors = sum(1 for item in responses if isinstance(item, dict) and "error" in item)
+            return f"Batch of {len(self.body)} calls, {errors} errors"
+        if not isinstance(self.body, dict):
+            return str(self.body)
+        summary = f"{self.body['method']} (id {self.body['id']})"
+        error = self.json_response.get("error") if isinstance(self.json_response, dict) else None
+        if error:
+            summary += f" error {error.get('code')}: {error.get('message')}"
+        return summary
+
+
+# JSON-RPC methods of the PLC Web API. Subclasses provide the transport by implementing _rpc().
+class WebApiMethods:
+    def __init__(self, ip, username, password, response_logging="summary", metrics=None):
+        if response_logging not in RESPONSE_LOGGING:
+            raise ValueError(f"response_logging must be one of {RESPONSE_LOGGING}")
         self.ip = ip
         self.username = username
         self.password = password
+        self.response_logging = response_logging
+        self.metrics = metrics
         self._id = 0
+        self._id_lock = threading.Lock()
         self._token = None
         self._url = f'https://{self.ip}/api/jsonrpc'
-
-    @staticmethod
-    def _print_response(body, response_code, response):
-        if isinstance(response, requests.Response):
-            try:
-                json_response = response.json()
-            except requests.exceptions.JSONDecodeError:
-                json_response = response.text
+        self._batch = contextvars.ContextVar(f"batch-{id(self)}", default=None)
+
+    def _log_response(self, body, response_code, json_response):
+        if self.response_logging == "off" or not logger.isEnabledFor(logging.INFO):
+            return
+        if self.response_logging == "full":
+            logger.info("%s\nRequest: %s\nResponse %s: %s", _Summary(body, json_response), _JsonText(body),
+                        response_code, _JsonText(json_response))
         else:
-            json_response = response  # If already a dictionary
+            logger.info("%s -> %s", _Summary(body, json_response), response_code)
 
-        response_data = {
-            "body": body,
-            "response_code": response_code,
-            "json_response": json_response
-        }
-        print(json.dumps(response_data, indent=4))
+    # Record a finished request in the ApiMetrics passed to the session, if any
+    def _record(self, kind, method, start_time, ok, size=None):
+        if self.metrics is not None:
+            self.metrics.record(self.ip, kind, method, time.perf_counter() - start_time, ok, size)
+
+    def _record_retry(self, kind, method):
+        if self.metrics is not None:
+            self.metrics.record_retry(self.ip, kind, method)
 
     def set_token(self, token):
         self._token = token
 
-    # Login
-    def login(self):
-        self._id += 1
+    def _headers(self):
         headers = {"Content-Type": "application/json"}
+        if self._token:
+            headers["X-Auth-Token"] = self._token
+        return headers
+
+    def _build_body(self, method, params=None):
+        with self._id_lock:
+            self._id += 1
+            request_id = self._id
         body = {
-            "id": self._id,
+            "id": request_id,
             "jsonrpc": "2.0",
-            "method": "Api.Login",
-            "params": {
-                "user": self.username,
-                "password": self.password
-            }
+            "method": method
         }
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in login request: {e}")
-            return None
+        if params is not None:
+            body["params"] = params
+        return body
+
+    def _rpc(self, name, method, params=None, extract=_result):
+        raise NotImplementedError
 
-        self._print_response(body, response.status_code, response)
+    # Login
+    def login(self):
+        params = {
+            "user": self.username,
+            "password": self.password
+        }
+        return self._rpc("login", "Api.Login", params, extract=self._store_token)
 
+    def _store_token(self, json_response):
         self._token = json_response.get("result", {}).get("token")
         return self._token
 
     # Logout
     def logout(self):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "Api.Logout"
-        }
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in logout request: {e}")
-            return None
+        return self._rpc("logout", "Api.Logout", extract=self._clear_token)
 
-        self._print_response(body, response.status_code, response)
+    def _clear_token(self, json_response):
         self._token = None
         return True
-    
+
     # Ping
     def ping(self):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "Api.Ping"
-        }
-
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in ping request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result", {})
+        return self._rpc("ping", "Api.Ping", extract=_result_or_empty)
 
     # Browse tickets
     def browse_tickets(self):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "Api.BrowseTickets"
-        }
-
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in browse tickets request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result", {}).get("tickets")
+        return self._rpc("browse tickets", "Api.BrowseTickets", extract=_result_tickets)
 
     # Close a ticket
     def close_ticket(self, ticket_id):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "Api.CloseTicket",
-            "params": {"id": ticket_id}
-        }
-
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in close ticket request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
-
-    # Upload a file
-    def upload_file(self, ticket_id, filename):
-        url = f'https://{self.ip}/api/ticket?id={ticket_id}'
-        headers = {"Content-Type": "application/octet-stream"}
-        try:
-            if not os.path.exists(filename):
-                print(f"Error: File '{filename}' does not exist.")
-                return None
-            with open(filename, "rb") as file:
-                file_contents = file.read()
-                print(f"File size: {len(file_contents)} bytes")
-            response = requests.post(url, data=file_contents, headers=headers, verify=False)
-            response.raise_for_status()
-        except (requests.exceptions.RequestException, IOError) as e:
-            print(f"Error in upload file request: {e}")
-            return None
-
-        self._print_response("N/A", response.status_code, response)
-
-    # Download a file
-    def download_file(self, ticket_id):
-        url = f'https://{self.ip}/api/ticket?id={ticket_id}'
-        headers = {"Content-Type": "application/octet-stream"}
-        try:
-            response = requests.get(url, verify=False)
-            response.raise_for_status()
-            filename = re.findall("filename=(.+)", response.headers.get("content-Disposition", ""))[0].strip('"')
-            with open(filename, "wb") as file:
-                file.write(response.content)
-        except (requests.exceptions.RequestException, IndexError, IOError) as e:
-            print(f"Error in download file request: {e}")
-            return None
-
-        self._print_response("N/A", response.status_code, response)
+        return self._rpc("close ticket", "Api.CloseTicket", {"id": ticket_id})
 
     # Web application create
     def web_app_create(self, name):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "WebApp.Create",
-            "params": {"name": name}
-        }
-
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in web app create request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
+        return self._rpc("web app create", "WebApp.Create", {"name": name})
 
     # Web application delete
     def web_app_delete(self, name):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "WebApp.Delete",
-            "params": {"name": name}
-        }
-
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in web app delete request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
+        return self._rpc("web app delete", "WebApp.Delete", {"name": name})
 
     # Web application browse
     def web_app_browse(self):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "WebApp.Browse"
-        }
+        return self._rpc("web app browse", "WebApp.Browse")
 
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in web app browse request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
+    # Web application rename
+    def web_app_rename(self, name, new_name):
+        params = {"name": name, "new_name": new_name}
+        return self._rpc("web app rename", "WebApp.Rename", params)
 
     # Web application set default page
     def web_app_set_default_page(self, name, resource_name):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "WebApp.SetDefaultPage",
-            "params": {"name": name, "resource_name": resource_name}
-        }
-
-        try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in web app set default page request: {e}")
-            return None
-
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
+        params = {"name": name, "resource_name": resource_name}
+        return self._rpc("web app set default page", "WebApp.SetDefaultPage", params)
 
     # Get media type
     @staticmethod
@@ -276,105 +282,540 @@ class WebApiSession:
         media_type, _ = mimetypes.guess_type(filename)
         return media_type if media_type else "application/octet-stream"
 
+    # Format a datetime or POSIX timestamp as used by the Web API (UTC, second precision)
+    @staticmethod
+    def _format_time(value=None):
+        if value is None:
+            value = datetime.now(timezone.utc)
+        elif not isinstance(value, datetime):
+            value = datetime.fromtimestamp(value, timezone.utc)
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
     # Web application create resource
-    def web_app_create_resource(self, app_name, name):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
+    # last_modified: datetime or POSIX timestamp (e.g. a file mtime), defaults to now
+    # visibility:    "public" or "protected", the PLC default is used if not given
+    # media_type:    guessed from the name if not given
+    def web_app_create_resource(self, app_name, name, last_modified=None, visibility=None, media_type=None):
+        time = self._format_time(last_modified)
+        media_type = media_type or self._get_media_type(name)
+
+        params = {
+            "app_name": app_name,
+            "name": name,
+            "media_type": media_type,
+            "last_modified": time
+        }
+        if visibility:
+            params["visibility"] = visibility
+        return self._rpc("web app create resource", "WebApp.CreateResource", params)
+
+    # Web application delete resource
+    def web_app_delete_resource(self, app_name, name):
+        params = {
+            "app_name": app_name,
+            "name": name
+        }
+        return self._rpc("web app delete resource", "WebApp.DeleteResource", params)
+
+    # Web application download resource
+    def web_app_download_resource(self, app_name, name):
+        params = {
+            "app_name": app_name,
+            "name": name
+        }
+        return self._rpc("web app download resource", "WebApp.DownloadResource", params)
 
-        time = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-        media_type = self._get_media_type(name)
+    # Web application browse resource
+    def web_app_browse_resource(self, app_name):
+        params = {
+            "app_name": app_name
+        }
+        return self._rpc("web app browse resource", "WebApp.BrowseResources", params)
 
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "WebApp.CreateResource",
-            "params": {
-                "app_name": app_name,
-                "name": name,
-                "media_type": media_type,
-                "last_modified": time
-            }
+    # Files browse
+    def browse_files(self, resource):
+        params = {
+            "resource": resource
+        }
+        return self._rpc("files browse", "Files.Browse", params)
+
+    # Files download
+    def files_download(self, resource):
+        params = {
+            "resource": resource
+        }
+        return self._rpc("files download", "Files.Download", params)
+
+    # Files delete
+    def files_delete(self, resource):
+        params = {
+            "resource": resource
+        }
+        return self._rpc("files delete", "Files.Delete", params)
+
+    # Files create
+    def create_file(self, resource):
+        params = {
+            "resource": resource
+        }
+        return self._rpc("files create", "Files.Create", params)
+
+    # PLC program browse
+    # var:  tag or structure to browse, e.g. "\"Data\".motor"; the data blocks and areas if not given
+    # mode: "children" lists the members of var, "var" describes var itself
+    def plc_program_browse(self, var=None, mode="children"):
+        params = {
+            "mode": mode
         }
+        if var is not None:
+            params["var"] = var
+        return self._rpc("plc program browse", "PlcProgram.Browse", params)
+
+    # PLC program read
+    # mode: "simple" returns the value as JSON, "raw" as a list of bytes
+    def plc_program_read(self, var, mode="simple"):
+        params = {
+            "var": var,
+            "mode": mode
+        }
+        return self._rpc("plc program read", "PlcProgram.Read", params)
+
+    # PLC program write
+    def plc_program_write(self, var, value, mode="simple"):
+        params = {
+            "var": var,
+            "value": value,
+            "mode": mode
+        }
+        return self._rpc("plc program write", "PlcProgram.Write", params)
+
+
+class WebApiSession(WebApiMethods):
+    # verify:         False to skip certificate checks, or a path to the PLC's CA bundle/certificate to pin it
+    # timeout:        (connect, read) timeout in seconds used for every request
+    # pool_maxsize:   number of keep-alive connections kept open to the PLC
+    # keep_alive:     reuse connections between calls instead of reconnecting each time
+    # token_cache:    TokenCache to reuse tokens across runs; close() then keeps the session open instead of logging out
+    # auto_login:     log in again and replay the call once when the PLC rejects the token
+    # response_logging: "off", "summary" or "full", see RESPONSE_LOGGING
+    # metrics:        ApiMetrics collecting latency, transfer and error statistics (see api_metrics.py)
+    def __init__(self, ip, username, password, verify=False, timeout=(10, 60), pool_maxsize=4, keep_alive=True,
+                 token_cache=None, auto_login=True, response_logging="summary", metrics=None):
+        super().__init__(ip, username, password, response_logging, metrics)
+        self.timeout = timeout
+        self.token_cache = token_cache
+        self.auto_login = auto_login
+        self._login_lock = threading.Lock()
+        # Methods still rejected after logging in again: the user lacks the right, the token was fine
+        self._denied_methods = set()
+        self._http = self._create_http_session(verify, pool_maxsize, keep_alive)
+
+    # Connection pool shared by all JSON-RPC and ticket requests
+    @staticmethod
+    def _create_http_session(verify, pool_maxsize, keep_alive):
+        http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        http.mount("https://", adapter)
+        http.verify = verify
+        # PLCs are reached directly; REQUESTS_CA_BUNDLE and proxy variables would override verify=False
+        http.trust_env = False
+        if not keep_alive:
+            http.headers["Connection"] = "close"
+        return http
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Log out (or keep the session for reuse if a token cache is used) and close the connection pool
+    def close(self):
+        if self._token:
+            if self.token_cache is not None:
+                self.token_cache.touch(self.ip, self.username)
+            else:
+                self.logout()
+        self._http.close()
+
+    # Login, reusing a cached token if the PLC has not restarted since it was issued
+    def login(self):
+        if self.token_cache is None or self._batch.get() is not None:
+            return super().login()
+
+        entry = self.token_cache.get(self.ip, self.username)
+        if entry:
+            ping_id = self.ping()
+            if ping_id and ping_id == entry.get("ping_id"):
+                self._token = entry["token"]
+                return self._token
+        return self._login_and_cache()
+
+    # Api.Login and Api.Ping in one request; the ping id identifies the PLC run the token belongs to
+    def _login_and_cache(self):
+        with self.batch():
+            token_call = super().login()
+            ping_call = self.ping()
+        if token_call.error:
+            logger.error("Error in login request: %s", token_call.error)
+        if self._token and self.token_cache is not None:
+            self.token_cache.put(self.ip, self.username, self._token, ping_call.result)
+        return self._token
 
+    # Logout
+    def logout(self):
+        result = super().logout()
+        if self.token_cache is not None:
+            self.token_cache.remove(self.ip, self.username)
+        return result
+
+    # Whether a call was rejected for its token, and logging in again may help
+    def _should_relogin(self, body, json_response):
+        return _is_auth_error(body, json_response) and body["method"] not in self._denied_methods
+
+    # Remember methods the PLC still rejects after logging in again, so they do not open a session each time
+    def _mark_denied(self, body, json_response):
+        if _is_auth_error(body, json_response) and body["method"] not in self._denied_methods:
+            logger.warning("%s rejected by %s after logging in again, not logging in again for it",
+                           body["method"], self.ip)
+            self._denied_methods.add(body["method"])
+
+    # Log in again after the PLC rejected used_token. Threads that hit the same expired token
+    # wait for one login instead of each opening a new session. The rejected session is logged out
+    # first, so it does not hold one of the PLC's session slots until it times out.
+    def _relogin(self, used_token):
+        if not self.auto_login or not self.password:
+            return False
+        with self._login_lock:
+            if self._token != used_token:
+                return bool(self._token)
+            logger.warning("Token rejected by %s, logging in again", self.ip)
+            if used_token:
+                WebApiMethods.logout(self)
+            self._token = None
+            if self.token_cache is not None:
+                self.token_cache.remove(self.ip, self.username)
+                return bool(self._login_and_cache())
+            return bool(super().login())
+
+    def _post_rpc(self, name, body):
+        start_time = time.perf_counter()
         try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
+            response = self._http.post(self._url, json=body, headers=self._headers(), timeout=self.timeout)
             response.raise_for_status()
             json_response = response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Error in web app create resource request: {e}")
+            self._record(RPC, body["method"], start_time, False)
+            logger.error("Error in %s request: %s", name, e)
             return None
 
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
-    
-    # Web application browse resource
-    def web_app_browse_resource(self, app_name):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "WebApp.BrowseResources",
-            "params": {
-                "app_name": app_name
-            }
-        }
+        self._record(RPC, body["method"], start_time, "error" not in json_response)
+        self._log_response(body, response.status_code, json_response)
+        return json_response
+
+    # Send one JSON-RPC call, or queue it if a batch is open in this context
+    def _rpc(self, name, method, params=None, extract=_result):
+        body = self._build_body(method, params)
+
+        batch = self._batch.get()
+        if batch is not None:
+            return batch.add(name, body, extract)
+
+        used_token = self._token
+        json_response = self._post_rpc(name, body)
+        if json_response is not None and self._should_relogin(body, json_response) and self._relogin(used_token):
+            self._record_retry(RPC, method)
+            json_response = self._post_rpc(name, body)
+            if json_response is not None:
+                self._mark_denied(body, json_response)
+        if json_response is None:
+            return None
+        return extract(json_response)
 
+    # Open a JSON-RPC batch: calls made inside the "with" block are queued and sent as arrays on exit
+    def batch(self, max_calls=50):
+        return WebApiBatch(self, max_calls)
+
+    # Upload a file
+    # source:   path of the file, a binary file object, or bytes/bytearray/memoryview/mmap
+    # progress: called as progress(bytes_sent, total_bytes, elapsed_seconds) while the body is sent
+    def upload_file(self, ticket_id, source, progress=None, chunk_size=UploadStream.CHUNK_SIZE):
+        url = f'https://{self.ip}/api/ticket?id={ticket_id}'
+        headers = {"Content-Type": "application/octet-stream"}
+        start_time = time.perf_counter()
         try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
+            with UploadStream(source, progress, chunk_size) as body:
+                logger.debug("Uploading %d bytes to ticket %s", len(body), ticket_id)
+                headers["Content-Length"] = str(len(body))
+                response = self._http.post(url, data=body, headers=headers, timeout=self.timeout)
             response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in web app browse resource request: {e}")
+        except (requests.exceptions.RequestException, IOError) as e:
+            self._record(UPLOAD, "upload_file", start_time, False)
+            logger.error("Error in upload file request: %s", e)
             return None
 
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
+        self._record(UPLOAD, "upload_file", start_time, True, len(body))
+        self._log_response(f"Upload to ticket {ticket_id}: {len(body)} bytes", response.status_code, None)
+        return True
 
-    # Files browse
-    def browse_files(self, resource):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "Files.Browse",
-            "params": {
-                "resource": resource
-            }
-        }
+    # Open a ticket for streaming download. With an offset only the rest of the file is requested
+    # with a Range header; a server that ignores it answers 200 with the whole file instead of 206.
+    def _open_ticket(self, ticket_id, offset=0):
+        url = f'https://{self.ip}/api/ticket?id={ticket_id}'
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        response = self._http.get(url, headers=headers, timeout=self.timeout, stream=True)
+        response.raise_for_status()
+        return response
+
+    # Copy a streamed response to write(chunk), checking the size if it is known.
+    # The first skip bytes are dropped, e.g. the part of a file that was already received.
+    @staticmethod
+    def _copy_response(response, write, expected_size=None, progress=None, chunk_size=256 * 1024, skip=0):
+        total = expected_size
+        if total is None and "Content-Length" in response.headers:
+            total = int(response.headers["Content-Length"]) - skip
+        start_time = time.perf_counter()
+        received = 0
+        for chunk in response.iter_content(chunk_size):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            write(chunk)
+            received += len(chunk)
+            if progress:
+                progress(received, total or received, time.perf_counter() - start_time)
+        if expected_size is not None and received != expected_size:
+            raise IOError(f"Size mismatch: received {received} bytes, expected {expected_size} bytes")
+        return received
 
+    @staticmethod
+    def _response_filename(response):
+        return re.findall("filename=(.+)", response.headers.get("content-Disposition", ""))[0].strip('"')
+
+    # Download a file
+    # destination:   file path, directory or binary file object; defaults to the file name sent by the PLC in the current directory
+    # expected_size: size from the Files.Browse listing, the download fails if the received size differs
+    # progress:      called as progress(bytes_received, total_bytes, elapsed_seconds)
+    # Files are written to a temporary file and renamed into place when complete. Returns the path (or True for file objects).
+    def download_file(self, ticket_id, destination=None, expected_size=None, progress=None):
+        temp_path = None
+        start_time = time.perf_counter()
         try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
-            response.raise_for_status()
-            json_response = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error in files browse request: {e}")
+            with self._open_ticket(ticket_id) as response:
+                if hasattr(destination, "write"):
+                    received = self._copy_response(response, destination.write, expected_size, progress)
+                    path = True
+                else:
+                    path = destination
+                    if path is None or os.path.isdir(path):
+                        path = os.path.join(path or "", self._response_filename(response))
+                    temp_path = f"{path}.part"
+                    with open(temp_path, "wb") as file:
+                        received = self._copy_response(response, file.write, expected_size, progress)
+                    os.replace(temp_path, path)
+                    temp_path = None
+        except (requests.exceptions.RequestException, IndexError, IOError) as e:
+            self._record(DOWNLOAD, "download_file", start_time, False)
+            logger.error("Error in download file request: %s", e)
+            return None
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self._record(DOWNLOAD, "download_file", start_time, True, received)
+        self._log_response(f"Download from ticket {ticket_id}: {received} bytes", response.status_code, None)
+        return path
+
+    # Download the contents of a ticket into memory, without touching the disk.
+    # offset: start at this byte, e.g. to fetch only what was appended to a file since the last download.
+    #         A Range request is tried first; if the PLC sends the whole file the bytes before offset are skipped.
+    # expected_size is the size of the whole file. Returns a memoryview over the received bytes.
+    def download_bytes(self, ticket_id, expected_size=None, progress=None, offset=0):
+        start_time = time.perf_counter()
+        try:
+            with self._open_ticket(ticket_id, offset) as response:
+                skip = offset if response.status_code != 206 else 0
+                expected = expected_size - offset if expected_size is not None else None
+                size = expected
+                if size is None and "Content-Length" in response.headers:
+                    size = int(response.headers["Content-Length"]) - skip
+                if size is not None and size < 0:
+                    # E.g. the file was replaced with a shorter one after it was browsed
+                    raise IOError(f"File is shorter than the offset {offset}")
+                if size is None:
+                    buffer = bytearray()
+                    self._copy_response(response, buffer.extend, expected, progress, skip=skip)
+                    self._record(DOWNLOAD, "download_bytes", start_time, True, len(buffer))
+                    return memoryview(buffer)
+
+                # Known size: fill a preallocated buffer instead of growing one
+                buffer = bytearray(size)
+                view = memoryview(buffer)
+                position = 0
+
+                def write(chunk):
+                    nonlocal position
+                    if position + len(chunk) > size:
+                        raise IOError(f"Size mismatch: received more than {size} bytes")
+                    view[position:position + len(chunk)] = chunk
+                    position += len(chunk)
+
+                received = self._copy_response(response, write, expected, progress, skip=skip)
+                self._record(DOWNLOAD, "download_bytes", start_time, True, received)
+                return view[:received]
+        except (requests.exceptions.RequestException, IOError) as e:
+            self._record(DOWNLOAD, "download_bytes", start_time, False)
+            logger.error("Error in download bytes request: %s", e)
             return None
 
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
-    
-    # Files create
-    def create_file(self, resource):
-        self._id += 1
-        headers = {"Content-Type": "application/json", "X-Auth-Token": self._token}
-        body = {
-            "id": self._id,
-            "jsonrpc": "2.0",
-            "method": "Files.Create",
-            "params": {
-                "resource": resource
-            }
-        }
+    # Download a file from the PLC file system through a Files.Download ticket.
+    # The size is verified against the Files.Browse listing. With in_memory=True the contents are returned as a memoryview.
+    def download_resource(self, resource, destination=None, progress=None, in_memory=False):
+        listing = self.browse_files(resource)
+        entries = listing.get("resources", []) if listing else []
+        name = resource.rstrip("/").rsplit("/", 1)[-1]
+        expected_size = next((entry.get("size") for entry in entries if entry.get("name") == name), None)
 
+        ticket_id = self.files_download(resource)
+        if not ticket_id:
+            return None
         try:
-            response = requests.post(self._url, json=body, headers=headers, verify=False)
+            if in_memory:
+                return self.download_bytes(ticket_id, expected_size, progress)
+            return self.download_file(ticket_id, destination, expected_size, progress)
+        finally:
+            self.close_ticket(ticket_id)
+
+
+# One queued call of a JSON-RPC batch. "result" and "error" are filled in when the batch is sent.
+class BatchCall:
+    def __init__(self, name, body, extract):
+        self.name = name
+        self.body = body
+        self.extract = extract
+        self.result = None
+        self.error = None
+        self.done = False
+
+    @property
+    def id(self):
+        return self.body["id"]
+
+    @property
+    def ok(self):
+        return self.done and self.error is None
+
+    def __repr__(self):
+        return f"BatchCall({self.body['method']}, id={self.id}, result={self.result!r}, error={self.error!r})"
+
+
+# Queues JSON-RPC calls made through a WebApiSession and sends them as batch arrays
+class WebApiBatch:
+    def __init__(self, session, max_calls=50):
+        self.session = session
+        self.max_calls = max_calls
+        self.calls = []
+        self._context_token = None
+
+    def __enter__(self):
+        self._open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._release()
+        if exc_type is None:
+            self.send()
+        return False
+
+    def _open(self):
+        if self.session._batch.get() is not None:
+            raise RuntimeError("A batch is already open in this context.")
+        self._context_token = self.session._batch.set(self)
+
+    def _release(self):
+        self.session._batch.reset(self._context_token)
+        self._context_token = None
+
+    def add(self, name, body, extract):
+        call = BatchCall(name, body, extract)
+        self.calls.append(call)
+        return call
+
+    @property
+    def results(self):
+        return [call.result for call in self.calls]
+
+    @property
+    def errors(self):
+        return [call for call in self.calls if call.error is not None]
+
+    def _chunks(self):
+        pending = [call for call in self.calls if not call.done]
+        for start in range(0, len(pending), self.max_calls):
+            yield pending[start:start + self.max_calls]
+
+    # Send queued calls in arrays of at most max_calls and correlate the responses by id
+    def send(self):
+        for calls in self._chunks():
+            self._send_chunk(calls)
+        return self.calls
+
+    def _send_chunk(self, calls, replay=True):
+        session = self.session
+        bodies = [call.body for call in calls]
+        used_token = session._token
+        start_time = time.perf_counter()
+        try:
+            response = session._http.post(session._url, json=bodies, headers=session._headers(),
+                                          timeout=session.timeout)
             response.raise_for_status()
             json_response = response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Error in files create request: {e}")
-            return None
+            session._record(BATCH, "batch", start_time, False)
+            logger.error("Error in batch request: %s", e)
+            self._fail(calls, {"message": str(e)})
+            return
+
+        session._log_response(bodies, response.status_code, json_response)
+        self._apply_response(calls, json_response)
+        session._record(BATCH, "batch", start_time, all(call.ok for call in calls))
+
+        # Replay calls rejected for an expired token once, after logging in again
+        rejected = [call for call in calls if session._should_relogin(call.body, {"error": call.error})]
+        if rejected and replay and session._relogin(used_token):
+            session._record_retry(BATCH, "batch")
+            for call in rejected:
+                call.error = None
+                call.done = False
+            self._send_chunk(rejected, replay=False)
+            for call in rejected:
+                session._mark_denied(call.body, {"error": call.error})
 
-        self._print_response(body, response.status_code, response)
-        return json_response.get("result")
\ No newline at end of file
+    @staticmethod
+    def _fail(calls, error):
+        for call in calls:
+            call.error = error
+            call.done = True
+
+    @classmethod
+    def _apply_response(cls, calls, json_response):
+        # A rejected batch is answered with a single error object instead of an array
+        if not isinstance(json_response, list):
+            error = json_response.get("error") if isinstance(json_response, dict) else None
+            cls._fail(calls, error or {"message": "Invalid batch response"})
+            return
+
+        by_id = {item.get("id"): item for item in json_response if isinstance(item, dict)}
+        for call in calls:
+            item = by_id.get(call.id)
+            call.done = True
+            if item is None:
+                call.error = {"message": "No response for request id"}
+            elif "error" in item:
+                call.error = item["error"]
+            else:
+                call.result = call.extract(item)
@@ -0,0 +1,221 @@
+import asyncio
+import re
+import ssl
+import os
+import time
+import aiohttp
+from api_metrics import RPC, BATCH, UPLOAD, DOWNLOAD
+from simatic_web_api import WebApiMethods, WebApiBatch, UploadStream, logger, _result
+
+
+# Asyncio counterpart of WebApiSession. All API methods are coroutines:
+#
+#     async with AsyncWebApiSession(ip, user, password) as api:
+#         await api.login()
+#         await api.web_app_browse()
+#
+# Several sessions (one per PLC) can share one aiohttp connection pool by passing http=AsyncWebApiSession.create_http_session().
+class AsyncWebApiSession(WebApiMethods):
+    # verify:          False to skip certificate checks, or a path to the PLC's CA bundle/certificate to pin it
+    # timeout:         total timeout in seconds for one request
+    # max_concurrency: maximum number of requests in flight to this PLC
+    # http:            shared aiohttp.ClientSession, created (and closed) by this session if not given
+    # response_logging: "off", "summary" or "full", see simatic_web_api.RESPONSE_LOGGING
+    # metrics:         ApiMetrics collecting latency, transfer and error statistics (see api_metrics.py)
+    def __init__(self, ip, username, password, verify=False, timeout=60, max_concurrency=4, http=None,
+                 response_logging="summary", metrics=None):
+        super().__init__(ip, username, password, response_logging, metrics)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._ssl = self._create_ssl_context(verify)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = http
+        self._owns_http = http is None
+
+    # Connection pool that can be shared by sessions to many PLCs
+    @staticmethod
+    def create_http_session(limit=100, limit_per_host=4, keepalive_timeout=30):
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, keepalive_timeout=keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector)
+
+    @staticmethod
+    def _create_ssl_context(verify):
+        if verify is False:
+            return False
+        if verify is True:
+            return None
+        return ssl.create_default_context(cafile=verify)
+
+    def _get_http(self):
+        if self._http is None:
+            self._http = self.create_http_session(limit_per_host=self.max_concurrency)
+        return self._http
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    # Log out (if logged in) and close the connection pool if this session created it
+    async def close(self):
+        if self._token:
+            await self.logout()
+        if self._owns_http and self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def _post_json(self, name, body):
+        kind, method = (BATCH, "batch") if isinstance(body, list) else (RPC, body["method"])
+        try:
+            async with self._semaphore:
+                # Timed from when the request may start, so waiting for the semaphore is not counted
+                start_time = time.perf_counter()
+                async with self._get_http().post(self._url, json=body, headers=self._headers(),
+                                                 ssl=self._ssl, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    json_response = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self._record(kind, method, start_time, False)
+            logger.error("Error in %s request: %s", name, e)
+            return None, None
+
+        ok = isinstance(json_response, dict) and "error" not in json_response
+        if kind == BATCH:
+            ok = isinstance(json_response, list) and not any("error" in item for item in json_response if isinstance(item, dict))
+        self._record(kind, method, start_time, ok)
+        return response.status, json_response
+
+    # Send one JSON-RPC call, or queue it if a batch is open in this task
+    async def _rpc(self, name, method, params=None, extract=_result):
+        body = self._build_body(method, params)
+
+        batch = self._batch.get()
+        if batch is not None:
+            return batch.add(name, body, extract)
+
+        status, json_response = await self._post_json(name, body)
+        if json_response is None:
+            return None
+
+        self._log_response(body, status, json_response)
+        return extract(json_response)
+
+    # Open a JSON-RPC batch: calls awaited inside the "async with" block are queued and sent as arrays on exit
+    def batch(self, max_calls=50):
+        return AsyncWebApiBatch(self, max_calls)
+
+    # Upload a file
+    # source:   path of the file, a binary file object, or bytes/bytearray/memoryview/mmap
+    # progress: called as progress(bytes_sent, total_bytes, elapsed_seconds) while the body is sent
+    async def upload_file(self, ticket_id, source, progress=None, chunk_size=UploadStream.CHUNK_SIZE):
+        url = f'https://{self.ip}/api/ticket?id={ticket_id}'
+        headers = {"Content-Type": "application/octet-stream"}
+        try:
+            async with self._semaphore:
+                start_time = time.perf_counter()
+                with UploadStream(source, progress, chunk_size) as body:
+                    logger.debug("Uploading %d bytes to ticket %s", len(body), ticket_id)
+                    headers["Content-Length"] = str(len(body))
+                    async with self._get_http().post(url, data=self._stream_chunks(body), headers=headers,
+                                                     ssl=self._ssl, timeout=self.timeout) as response:
+                        response.raise_for_status()
+                        status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, IOError) as e:
+            self._record(UPLOAD, "upload_file", start_time, False)
+            logger.error("Error in upload file request: %s", e)
+            return None
+
+        self._record(UPLOAD, "upload_file", start_time, True, len(body))
+        self._log_response(f"Upload to ticket {ticket_id}: {len(body)} bytes", status, None)
+        return True
+
+    # Disk reads run in a worker thread so they do not block the event loop
+    @staticmethod
+    async def _stream_chunks(body):
+        while True:
+            chunk = await asyncio.to_thread(body.read) if body.is_file else body.read()
+            if not len(chunk):
+                break
+            yield chunk
+
+    # Download a file
+    # destination:   file path, directory or binary file object; defaults to the file name sent by the PLC in the current directory
+    # expected_size: size from the Files.Browse listing, the download fails if the received size differs
+    # progress:      called as progress(bytes_received, total_bytes, elapsed_seconds)
+    # Files are written to a temporary file and renamed into place when complete. Returns the path (or True for file objects).
+    async def download_file(self, ticket_id, destination=None, expected_size=None, progress=None, chunk_size=256 * 1024):
+        url = f'https://{self.ip}/api/ticket?id={ticket_id}'
+        temp_path = None
+        file = None
+        try:
+            async with self._semaphore:
+                start_time = time.perf_counter()
+                async with self._get_http().get(url, ssl=self._ssl, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    status = response.status
+                    if hasattr(destination, "write"):
+                        file, path = destination, True
+                    else:
+                        path = destination
+                        if path is None or os.path.isdir(path):
+                            filename = re.findall("filename=(.+)", response.headers.get("content-Disposition", ""))[0].strip('"')
+                            path = os.path.join(path or "", filename)
+                        temp_path = f"{path}.part"
+                        file = open(temp_path, "wb")
+
+                    total = expected_size or response.content_length
+                    received = 0
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        file.write(chunk)
+                        received += len(chunk)
+                        if progress:
+                            progress(received, total or received, time.perf_counter() - start_time)
+            if expected_size is not None and received != expected_size:
+                raise IOError(f"Size mismatch: received {received} bytes, expected {expected_size} bytes")
+            if temp_path:
+                file.close()
+                os.replace(temp_path, path)
+                temp_path = None
+        except (aiohttp.ClientError, asyncio.TimeoutError, IndexError, IOError) as e:
+            self._record(DOWNLOAD, "download_file", start_time, False)
+            logger.error("Error in download file request: %s", e)
+            return None
+        finally:
+            if temp_path:
+                if file is not None:
+                    file.close()
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        self._record(DOWNLOAD, "download_file", start_time, True, received)
+        self._log_response(f"Download from ticket {ticket_id}: {received} bytes", status, None)
+        return path
+
+
+# Async version of WebApiBatch, used with "async with api.batch():"
+class AsyncWebApiBatch(WebApiBatch):
+    async def __aenter__(self):
+        self._open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._release()
+        if exc_type is None:
+            await self.send()
+        return False
+
+    async def send(self):
+        await asyncio.gather(*(self._send_chunk(calls) for calls in self._chunks()))
+        return self.calls
+
+    async def _send_chunk(self, calls):
+        bodies = [call.body for call in calls]
+        status, json_response = await self.session._post_json("batch", bodies)
+        if json_response is None:
+            self._fail(calls, {"message": "Batch request failed"})
+            return
+
+        self.session._log_response(bodies, status, json_response)
+        self._apply_response(calls, json_response)
@@ -0,0 +1,161 @@
+import threading
+import time
+import numpy as np
+from api_metrics import RequestStats
+from plc_tags import PlcTags
+
+# Groups due within this many seconds of each other are read with the same request
+COALESCE_WINDOW = 0.005
+
+
+# Fixed-size buffer of the latest samples of a group: one row of values per sample, the oldest
+# row is overwritten when full. valid marks the values that could be read.
+class RingBuffer:
+    def __init__(self, capacity, width, dtype="f8"):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype="f8")
+        self.values = np.zeros((capacity, width), dtype=dtype)
+        self.valid = np.zeros((capacity, width), dtype=bool)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, values, valid):
+        with self._lock:
+            row = self.count % self.capacity
+            self.times[row] = timestamp
+            self.values[row] = values
+            self.valid[row] = valid
+            self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # Copies of the latest n samples (all if n is not given), oldest first: (times, values, valid).
+    # Times are POSIX timestamps of the requests.
+    def latest(self, n=None):
+        with self._lock:
+            size = min(self.count, self.capacity)
+            n = size if n is None else min(n, size)
+            rows = np.arange(self.count - n, self.count) % self.capacity
+            return self.times[rows], self.values[rows], self.valid[rows]
+
+
+# Tags sampled together at a fixed interval (seconds)
+class PollGroup:
+    def __init__(self, name, tags, interval, capacity=1000):
+        self.name = name
+        self.tags = list(tags)
+        self.interval = interval
+        self.capacity = capacity
+        self.buffer = None
+        self.next_due = None
+        self.samples = 0
+        self.missed = 0
+        # Seconds each request started after its deadline
+        self.lateness = RequestStats(capacity)
+
+    def to_dict(self):
+        return {
+            "interval": self.interval,
+            "samples": self.samples,
+            "missed": self.missed,
+            "errors": self.lateness.errors,
+            "jitter_p50_seconds": self.lateness.percentile(50),
+            "jitter_p95_seconds": self.lateness.percentile(95),
+            "jitter_max_seconds": self.lateness.max_seconds
+        }
+
+
+# Samples groups of tags of one PLC at their intervals in a background thread.
+#
+#     sampler = TagSampler(api, [PollGroup("fast", fast_tags, 0.1), PollGroup("slow", slow_tags, 10)])
+#     with sampler:
+#         ...
+#         times, values, valid = sampler.groups["fast"].buffer.latest(50)
+#
+# Deadlines are fixed on a grid from the start time, so a slow request does not shift later samples.
+# All groups due at the same time are read with one batch request. If the PLC cannot keep up,
+# deadlines that have already passed are skipped and counted as missed instead of being read late
+# in a burst. Each sample is stored in the group's RingBuffer, typed from the tag metadata.
+#
+# tags: PlcTags to read with, e.g. to share its metadata cache; created from api if not given
+# log:  called with errors, from the sampler thread
+class TagSampler:
+    def __init__(self, api, groups, tags=None, log=print):
+        self.api = api
+        self.groups = {group.name: group for group in groups}
+        self.tags = tags or PlcTags(api)
+        self.log = log
+        self.requests = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        for group in self.groups.values():
+            if group.buffer is None:
+                dtypes = [dtype for dtype in self.tags.dtypes(group.tags) if dtype is not None]
+                dtype = np.result_type(*dtypes) if dtypes else np.dtype("f8")
+                group.buffer = RingBuffer(group.capacity, len(group.tags), dtype)
+        now = time.monotonic()
+        for group in self.groups.values():
+            group.next_due = now
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"TagSampler-{self.api.ip}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            next_due = min(group.next_due for group in self.groups.values())
+            if self._stop.wait(max(0.0, next_due - time.monotonic())):
+                break
+            due = [group for group in self.groups.values() if group.next_due <= next_due + COALESCE_WINDOW]
+            try:
+                self.sample(due)
+            except Exception as e:
+                self.log(f"{self.api.ip}: sampling failed: {e}")
+            for group in due:
+                self._advance(group)
+
+    # Next deadline on the grid; deadlines that passed while reading are skipped
+    @staticmethod
+    def _advance(group):
+        group.next_due += group.interval
+        now = time.monotonic()
+        if group.next_due < now:
+            skipped = int((now - group.next_due) // group.interval) + 1
+            group.missed += skipped
+            group.next_due += skipped * group.interval
+
+    # Read the tags of all given groups with one request and store a sample in each group
+    def sample(self, groups):
+        start = time.monotonic()
+        timestamp = time.time()
+        tags = list(dict.fromkeys(tag for group in groups for tag in group.tags))
+        values = self.tags.read(tags)
+        self.requests += 1
+        ok = any(value is not None for value in values.values())
+
+        for group in groups:
+            row = [values[tag] for tag in group.tags]
+            valid = [value is not None for value in row]
+            group.buffer.append(timestamp, [value if value is not None else 0 for value in row], valid)
+            group.samples += 1
+            group.lateness.add(max(0.0, start - group.next_due), ok, None)
+
+    # {group name: statistics} of samples, missed deadlines and jitter
+    def stats(self):
+        return {name: group.to_dict() for name, group in self.groups.items()}
@@ -0,0 +1,230 @@
+import os
+import numpy as np
+import pytest
+import web_app_deploy
+from downsample import merge_level
+from follow_file import TailFollower
+from harvest_files import files_to_rotate
+from mock_plc import MockPlc, MockPlcServer, generate_certificate
+from plc_data_file import CONFIG, header_size, record_dtype
+from simatic_web_api import WebApiSession
+from transfer_journal import CLOSED, CREATED, TransferJournal, sweep_tickets
+from web_app_deploy import diff_manifest, staged_deploy_web_app, sync_web_app, upload_resources
+
+# Resume, sweep, retry and follow paths driven through the mock PLC: python -m pytest -q
+
+
+def _quiet(*args):
+    pass
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    return generate_certificate(str(tmp_path_factory.mktemp("certificate")))
+
+
+@pytest.fixture
+def server(certificate):
+    certfile, keyfile = certificate
+    with MockPlcServer(MockPlc(), certfile=certfile, keyfile=keyfile) as server:
+        yield server
+
+
+@pytest.fixture
+def api(server):
+    with WebApiSession(server.address, "admin", "admin", response_logging="off") as api:
+        assert api.login()
+        yield api
+
+
+@pytest.fixture
+def app_folder(tmp_path):
+    folder = tmp_path / "app"
+    folder.mkdir()
+    for number in range(8):
+        (folder / f"file{number}.bin").write_bytes(os.urandom(4096 + number))
+    (folder / "index.html").write_bytes(b"<html></html>")
+    return str(folder)
+
+
+def _remote_sizes(api, app_name):
+    result = api.web_app_browse_resource(app_name)
+    return {resource["name"]: resource["size"] for resource in result["resources"]}
+
+
+def _local_sizes(folder):
+    return {name: os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)}
+
+
+# Upload the first half of the files, then fail like a crashed process would
+def _crash_halfway(monkeypatch):
+    upload = web_app_deploy.upload_resources
+
+    def crash(api, app_name, files, *args, **kwargs):
+        upload(api, app_name, files[:len(files) // 2], *args, **kwargs)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(web_app_deploy, "upload_resources", crash)
+
+
+def test_interrupted_sync_resumes(api, app_folder, tmp_path, monkeypatch):
+    journal_path = str(tmp_path / "journal.jsonl")
+    with monkeypatch.context() as patch:
+        _crash_halfway(patch)
+        with TransferJournal(journal_path) as journal, pytest.raises(KeyboardInterrupt):
+            sync_web_app(api, "HMI", app_folder, "index.html", log=_quiet, journal=journal)
+
+    # Newer mtimes make every file look changed without a stored manifest; the journal has their hashes
+    for name in os.listdir(app_folder):
+        os.utime(os.path.join(app_folder, name), (2e9, 2e9))
+    with TransferJournal(journal_path) as journal:
+        report = sync_web_app(api, "HMI", app_folder, "index.html", log=_quiet, journal=journal)
+        assert report.ok
+        assert len(report.unchanged) == 4
+        assert len(report.resources) == 5
+        assert journal.job_items(f"{api.ip}/HMI") == {}
+    remote = _remote_sizes(api, "HMI")
+    remote.pop(web_app_deploy.MANIFEST_NAME)
+    assert remote == _local_sizes(app_folder)
+
+
+def test_interrupted_staged_deploy_resumes(api, app_folder, tmp_path, monkeypatch):
+    journal_path = str(tmp_path / "journal.jsonl")
+    with monkeypatch.context() as patch:
+        _crash_halfway(patch)
+        with TransferJournal(journal_path) as journal, pytest.raises(KeyboardInterrupt):
+            staged_deploy_web_app(api, "HMI", app_folder, "index.html", log=_quiet, journal=journal)
+
+    # A resource the crashed run left half uploaded is deleted and uploaded again
+    with TransferJournal(journal_path) as journal:
+        report = staged_deploy_web_app(api, "HMI", app_folder, "index.html", log=_quiet, journal=journal)
+        assert report.ok
+        assert len(report.unchanged) == 4
+        assert len(report.resources) == 5
+        assert journal.job_items(f"{api.ip}/HMI_staged") == {}
+    assert [app["name"] for app in api.web_app_browse()["applications"]] == ["HMI"]
+    assert _remote_sizes(api, "HMI") == _local_sizes(app_folder)
+
+
+def test_open_ticket_is_swept(api, tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    assert api.web_app_create("HMI")
+    ticket_id = api.web_app_create_resource("HMI", "left_open.bin")
+    with TransferJournal(journal_path) as journal:
+        journal.record(f"{api.ip}/HMI", "left_open.bin", CREATED, ticket_id=ticket_id)
+        # Tickets of other PLCs in the same journal are left alone
+        journal.record("192.0.2.1/HMI", "other.bin", CREATED, ticket_id="other")
+
+    with TransferJournal(journal_path) as journal:
+        assert sweep_tickets(api, journal, log=_quiet) == [ticket_id]
+        assert api.browse_tickets() == []
+        assert list(journal.open_tickets()) == ["other"]
+
+
+def test_journal_ignores_partly_written_line(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    with TransferJournal(journal_path) as journal:
+        journal.record("plc/HMI", "index.html", CLOSED, sha256="abc")
+    with open(journal_path, "a", encoding="utf-8") as file:
+        file.write('{"time": 1, "job": "plc/HMI", "item": "index.html", "st')
+
+    with TransferJournal(journal_path) as journal:
+        assert journal.state("plc/HMI", "index.html")["step"] == CLOSED
+        journal.record("plc/HMI", "main.js", CREATED, ticket_id="t1")
+    with TransferJournal(journal_path) as journal:
+        assert journal.state("plc/HMI", "main.js")["ticket_id"] == "t1"
+
+
+def test_failed_uploads_are_retried(api, app_folder, monkeypatch):
+    monkeypatch.setattr(web_app_deploy, "backoff_delays", lambda retries: iter([0.0] * retries))
+    upload_file = api.upload_file
+    # Failures left per file, the files told apart by their size
+    failures = {4097: 2, 4101: 1}
+
+    def flaky_upload(ticket_id, source, *args, **kwargs):
+        if failures.get(len(source)):
+            failures[len(source)] -= 1
+            return None
+        return upload_file(ticket_id, source, *args, **kwargs)
+
+    monkeypatch.setattr(api, "upload_file", flaky_upload)
+    assert api.web_app_create("HMI")
+    files = web_app_deploy.list_resource_files(app_folder)
+    contents = {name: open(path, "rb").read() for name, path in files}
+    uploads = upload_resources(api, "HMI", files, log=_quiet, contents=contents, retries=2)
+    assert all(upload.ok for upload in uploads)
+    assert failures == {4097: 0, 4101: 0}
+    assert _remote_sizes(api, "HMI") == _local_sizes(app_folder)
+
+
+def test_diff_manifest():
+    local = {"same.js": {"sha256": "1", "size": 1, "last_modified": "a"},
+             "changed.js": {"sha256": "2", "size": 1, "last_modified": "a"},
+             "unhashed.js": {"sha256": "3", "size": 5, "last_modified": "a"},
+             "new.js": {"sha256": "4", "size": 1, "last_modified": "a"}}
+    remote_resources = [{"name": name, "size": 1, "last_modified": "b"}
+                        for name in ("same.js", "changed.js", "unhashed.js", "removed.js", "deploy-manifest.json")]
+    remote_manifest = {"same.js": {"sha256": "1"}, "changed.js": {"sha256": "old"}}
+    upload, delete, unchanged = diff_manifest(local, remote_resources, remote_manifest)
+    assert sorted(upload) == ["changed.js", "new.js", "unhashed.js"]
+    assert delete == ["removed.js"]
+    assert unchanged == ["same.js"]
+
+
+def test_rotate_only_unchanged_files():
+    entries = [("/UserFiles/a.bin", {"size": 10, "last_modified": "1"}),
+               ("/UserFiles/b.bin", {"size": 10, "last_modified": "2"}),
+               ("/UserFiles/c.bin", {"size": 10, "last_modified": "3"}),
+               ("/UserFiles/d.bin", {"size": 10, "last_modified": "4"})]
+    index = {"/UserFiles/a.bin": {"size": 10, "last_modified": "1"},
+             "/UserFiles/b.bin": {"size": 10, "last_modified": "0"},
+             "/UserFiles/c.bin": {"size": 10, "last_modified": "3"},
+             "/UserFiles/d.bin": {"size": 10, "last_modified": "4"}}
+    # b was rewritten with the same size, c failed this run and d is the newest file
+    assert files_to_rotate(entries, index, failed=["/UserFiles/c.bin"]) == ["/UserFiles/a.bin"]
+
+
+def test_merged_means_ignore_nan():
+    values = np.arange(64, dtype=np.float32)
+    values[[1, 2, 3, 17, 40, 41]] = np.nan
+    finer = {"index": np.arange(0, 64, 8), "count": np.full(8, 8, dtype=np.uint32)}
+    buckets = values.reshape(8, 8)
+    numbers = ~np.isnan(buckets)
+    finer["Flow_valid"] = numbers.sum(axis=1).astype(np.uint32)
+    finer["Flow_mean"] = np.nansum(buckets, axis=1) / finer["Flow_valid"]
+
+    merged = merge_level(finer, 4)
+    assert np.allclose(merged["Flow_mean"], [np.nanmean(values[:32]), np.nanmean(values[32:])])
+    assert merged["Flow_valid"].tolist() == [28, 30]
+
+
+# A test data file with records whose Flow counts up from first
+def _data_file(records, first=0.0, identifier="Test-1"):
+    header = bytearray(header_size(CONFIG))
+    name = identifier.encode()
+    header[:2 + len(name)] = bytes([32, len(name)]) + name
+    data = np.zeros(records, dtype=record_dtype())
+    data["Flow"] = first + np.arange(records)
+    return bytes(header) + data.tobytes()
+
+
+def test_follower_starts_over_on_replaced_file(server, api, tmp_path):
+    resource = "/UserFiles/Test-1_00001.bin"
+    output = str(tmp_path / "Test-1_00001.bin")
+    server.plc.add_file(resource, _data_file(100), last_modified="2024-01-01T00:00:00Z")
+    follower = TailFollower(api, resource, output, log=_quiet)
+    assert len(follower.poll()) == 100
+
+    # Replaced by a longer file with other records, then by one of the same size
+    server.plc.add_file(resource, _data_file(150, first=1000.0), last_modified="2024-01-01T00:00:10Z")
+    follower.poll()
+    follower.poll()
+    assert follower.records == 150
+    with open(output, "rb") as file:
+        assert file.read() == _data_file(150, first=1000.0)
+
+    server.plc.add_file(resource, _data_file(150, first=5000.0), last_modified="2024-01-01T00:00:20Z")
+    records = follower.poll()
+    assert len(records) == 150 and records["Flow"][0] == 5000.0
+    with open(output, "rb") as file:
+        assert file.read() == _data_file(150, first=5000.0)
@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".simatic_web_api", "tokens.json")
+
+# The PLC drops a session after 120 s without requests
+TOKEN_LIFETIME = 120
+
+
+# Web API tokens persisted in a local JSON file, keyed by PLC and user, so that separate script runs
+# can reuse a session instead of logging in again. Each entry stores the token, when it expires and
+# the Api.Ping id of the PLC (which changes when the PLC restarts, invalidating all tokens).
+# The file is only readable by the current user and is replaced atomically on every write.
+class TokenCache:
+    def __init__(self, path=DEFAULT_PATH, lifetime=TOKEN_LIFETIME):
+        self.path = path
+        self.lifetime = lifetime
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ip, username):
+        return f"{ip}|{username}"
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.part"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(entries, file, indent=1)
+        os.replace(temp_path, self.path)
+
+    # Cached entry {"token", "expires", "ping_id"} if it has not expired, otherwise None
+    def get(self, ip, username):
+        entry = self._load().get(self._key(ip, username))
+        if entry and entry.get("expires", 0) > time.time():
+            return entry
+        return None
+
+    def put(self, ip, username, token, ping_id=None):
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            entries = {key: entry for key, entry in entries.items() if entry.get("expires", 0) > now}
+            entries[self._key(ip, username)] = {
+                "token": token,
+                "expires": now + self.lifetime,
+                "ping_id": ping_id
+            }
+            self._save(entries)
+
+    # Extend the expiry after the token was used
+    def touch(self, ip, username):
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(self._key(ip, username))
+            if entry:
+                entry["expires"] = time.time() + self.lifetime
+                self._save(entries)
+
+    def remove(self, ip, username):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(self._key(ip, username), None) is not None:
+                self._save(entries)
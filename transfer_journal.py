@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Steps recorded for each item of a job, in order
+PLANNED = "planned"
+CREATED = "created"
+TRANSFERRED = "transferred"
+CLOSED = "closed"
+FAILED = "failed"
+# Recorded by sweep_tickets() for a ticket closed on behalf of an interrupted run; keeps the item's step
+SWEPT = "swept"
+
+
+# Append-only journal (JSON lines) of the steps of deployments and harvests, so an interrupted run can
+# resume where it stopped and tickets it left open can be found again. Each line is one step of one
+# item (a resource or file) of a job, e.g.
+#
+#     {"time": ..., "job": "192.168.0.1/HMI", "item": "index.html", "step": "created", "ticket_id": "..."}
+#
+# The file is read back on construction; the latest step of each item wins. Lines are flushed as they
+# are written, a partly written last line (from a crash) is removed.
+class TransferJournal:
+    def __init__(self, path):
+        self.path = path
+        self.items = {}
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as file:
+            content = file.read()
+            # Drop a partly written last line, so the next entry starts on a line of its own
+            complete = content.rfind(b"\n") + 1
+            if complete < len(content):
+                file.truncate(complete)
+        for line in content[:complete].decode("utf-8", errors="replace").splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self._apply(entry)
+
+    def _apply(self, entry):
+        state = self.items.setdefault((entry["job"], entry["item"]), {})
+        if entry["step"] == SWEPT:
+            state["ticket_closed"] = True
+            return
+        state.update({name: value for name, value in entry.items() if name not in ("job", "item")})
+
+    def record(self, job, item, step, **data):
+        entry = {"time": time.time(), "job": job, "item": item, "step": step, **data}
+        with self._lock:
+            self._apply(entry)
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    # Latest state of an item: {"step", "time", ...data}, or None if nothing was recorded
+    def state(self, job, item):
+        with self._lock:
+            state = self.items.get((job, item))
+            return dict(state) if state else None
+
+    # {item: state} of all items of a job
+    def job_items(self, job):
+        with self._lock:
+            return {item: dict(state) for (item_job, item), state in self.items.items() if item_job == job}
+
+    # Tickets recorded as opened but never closed: {ticket id: (job, item)}, of jobs starting with prefix
+    def open_tickets(self, prefix=""):
+        with self._lock:
+            return {state["ticket_id"]: key for key, state in self.items.items()
+                    if key[0].startswith(prefix) and state.get("ticket_id") and not state.get("ticket_closed")}
+
+    # Forget a finished job; the file is rewritten without it
+    def clear(self, job):
+        with self._lock:
+            self.items = {key: state for key, state in self.items.items() if key[0] != job}
+            self._rewrite()
+
+    def _rewrite(self):
+        self._file.close()
+        temp_path = f"{self.path}.part"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for (job, item), state in self.items.items():
+                file.write(json.dumps({"job": job, "item": item, **state}) + "\n")
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+# Seconds to wait before each retry: delay, 2 * delay, 4 * delay, ... capped at max_delay
+def backoff_delays(retries, delay=1.0, max_delay=30.0):
+    for attempt in range(retries):
+        yield min(delay * 2 ** attempt, max_delay)
+
+
+def _ticket_age(ticket, now):
+    try:
+        created = datetime.strptime(ticket["date_created"][:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (now - created).total_seconds()
+
+
+# Close tickets left open on the PLC by interrupted runs, in one batch request.
+# Tickets the journal recorded as opened and not closed are always closed; with older_than (seconds)
+# any ticket created longer ago is closed too, also those of other clients, so use it with care.
+# Returns the ids of the closed tickets.
+def sweep_tickets(api, journal=None, older_than=None, log=print):
+    tickets = api.browse_tickets()
+    if tickets is None:
+        log("Browsing tickets failed")
+        return []
+
+    # Jobs are named "<ip>/<app or directory>"
+    ours = journal.open_tickets(f"{api.ip}/") if journal is not None else {}
+    now = datetime.now(timezone.utc)
+    orphaned = []
+    for ticket in tickets:
+        age = _ticket_age(ticket, now)
+        if ticket["id"] in ours or (older_than is not None and age is not None and age > older_than):
+            orphaned.append(ticket["id"])
+
+    closed = []
+    if orphaned:
+        with api.batch():
+            calls = [api.close_ticket(ticket_id) for ticket_id in orphaned]
+        for ticket_id, call in zip(orphaned, calls):
+            if call.ok:
+                closed.append(ticket_id)
+            else:
+                log(f"Closing ticket {ticket_id} failed: {call.error}")
+        log(f"Closed {len(closed)} orphaned tickets")
+
+    # Tickets the PLC no longer has are closed as far as the journal is concerned
+    if journal is not None:
+        still_open = {ticket["id"] for ticket in tickets} - set(closed)
+        for ticket_id, (job, item) in ours.items():
+            if ticket_id not in still_open:
+                journal.record(job, item, SWEPT)
+    return closed
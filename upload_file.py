@@ -8,11 +8,16 @@ file_path = "./notes.txt"
 #--------------------------------------------------------------------
 
 # Imports
+import logging
 import os
-from simatic_web_api import WebApiSession
+from simatic_web_api import WebApiSession, print_progress
+from token_cache import TokenCache
+
+# Log one line per API call; use logging.DEBUG for more detail
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 # Initialize API session
-api = WebApiSession(ip=ip_address, username=username, password=password)
+api = WebApiSession(ip=ip_address, username=username, password=password, token_cache=TokenCache())
 
 #Ping
 result = api.ping()
@@ -29,7 +34,7 @@ if result:
         ticket_id = api.create_file(resource)
         print(f"Ticket ID for {resource}: {ticket_id}")
                 
-        result = api.upload_file(ticket_id, file_path)
+        result = api.upload_file(ticket_id, file_path, progress=print_progress)
         print(f"Upload result for {resource}: {result}")
 
         result = api.close_ticket(ticket_id)
@@ -38,7 +43,7 @@ if result:
         result = api.browse_files("/")
         print("Browse files result:", result)
 
-    # Logout
-    api.logout()
+    # Close the connection pool; the session is kept in the token cache for the next run
+    api.close()
 
 
@@ -6,14 +6,26 @@ password = "Siemens1234!"
 app_name = "TestApp"
 folder_path = "web_files"
 default_page_name = "index.html"
+max_open_tickets = 8
+upload_workers = 4
+incremental = True  # Only upload changed files instead of uploading the whole app into a staged copy
+journal_path = "deploy-journal.jsonl"  # Resume an interrupted deploy and close tickets it left open
+retries = 2  # Attempts to upload failed files again
 #--------------------------------------------------------------------
 
 # Imports
-import os
+import logging
 from simatic_web_api import WebApiSession
+from token_cache import TokenCache
+from transfer_journal import TransferJournal, sweep_tickets
+from web_app_deploy import staged_deploy_web_app, sync_web_app
+
+# Log one line per API call; use logging.DEBUG for more detail
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 # Initialize API session
-api = WebApiSession(ip=ip_address, username=username, password=password)
+api = WebApiSession(ip=ip_address, username=username, password=password, token_cache=TokenCache())
+ok = False
 
 #Ping
 result = api.ping()
@@ -27,35 +39,28 @@ if result:
 
     if token:
 
-        # Delete app that has the same name
-        result = api.web_app_delete(app_name)
-        print("Web App Delete result:", result)
-
-        # Create new app
-        result = api.web_app_create(app_name)
-        print("Web App Create result:", result)
-
-        # Create and upload resources
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-
-            if os.path.isfile(file_path):  # Ensure it's a file, not a subfolder
-                ticket_id = api.web_app_create_resource(app_name, filename)
-                print(f"Ticket ID for {filename}: {ticket_id}")
-                
-                result = api.upload_file(ticket_id, file_path)
-                print(f"Upload result for {filename}: {result}")
-
-                result = api.close_ticket(ticket_id)
-                print(f"Ticket ID {ticket_id} delete result: {result}")
-
-        # Set default page for the application
-        result = api.web_app_set_default_page(app_name, default_page_name)
-        print("Set default page result:", result)
+        # Upload resources in parallel and set the default page, either syncing only changed
+        # files or uploading the whole app into a staged copy that replaces the live one when complete
+        with TransferJournal(journal_path) as journal:
+            sweep_tickets(api, journal)
+            if incremental:
+                report = sync_web_app(api, app_name, folder_path, default_page_name, workers=upload_workers,
+                                      max_open_tickets=max_open_tickets, journal=journal, retries=retries)
+            else:
+                report = staged_deploy_web_app(api, app_name, folder_path, default_page_name, workers=upload_workers,
+                                               max_open_tickets=max_open_tickets, retries=retries, journal=journal)
+        for resource in report.resources:
+            print(f"{resource.name}: {resource.size} bytes, {resource.upload_time:.3f} s, ok={resource.ok}")
+        print(report.summary())
+        ok = report.ok
 
         # Check results
         api.web_app_browse()
         api.web_app_browse_resource(app_name)
 
-    # Logout
-    api.logout()
\ No newline at end of file
+    # Close the connection pool; the session is kept in the token cache for the next run
+    api.close()
+
+# Exit non-zero if the deploy failed, including a staged deploy whose swap failed after every upload
+if not ok:
+    raise SystemExit(1)
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from deploy_fleet import deploy_fleet
+from simatic_web_api import WebApiSession
+from web_app_deploy import MANIFEST_NAME, WebAppContents, staged_deploy_web_app
+
+# Archive layout: the metadata as JSON and every resource under RESOURCE_DIR
+METADATA_NAME = "webapp.json"
+RESOURCE_DIR = "resources/"
+
+
+# last_modified as sent by the PLC: seconds with an optional fraction, in UTC ("Z") or with an offset
+_TIME_PATTERN = re.compile(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?(Z|[+-]\d\d:?\d\d)$")
+
+
+# POSIX timestamp of a last_modified value. Raises ValueError for any other format.
+def _parse_time(value):
+    match = _TIME_PATTERN.match(value or "")
+    if match is None:
+        raise ValueError(f"Unsupported time format: {value!r}")
+    seconds, fraction, zone = match.groups()
+    tzinfo = timezone.utc
+    if zone != "Z":
+        zone = zone.replace(":", "")
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[3:5]))
+        tzinfo = timezone(offset if zone[0] == "+" else -offset)
+    moment = datetime.strptime(seconds, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=tzinfo)
+    return moment.timestamp() + (float(fraction) if fraction else 0.0)
+
+
+# A web app held in memory: the resources downloaded from a PLC or read from a backup archive,
+# with their media type, last_modified and visibility. It can be deployed like a LocalWebApp
+# (deploy_web_app, staged_deploy_web_app, sync_web_app, deploy_fleet) without writing it to disk,
+# and the resources are created with the metadata of the original ones. A resource without
+# last_modified gets the time the snapshot was created; an unreadable one raises ValueError.
+#
+# metadata: {"app_name", "default_page", "state", "plc", "created",
+#            "resources": [{"name", "media_type", "last_modified", "visibility", "size", "sha256"}]}
+class WebAppSnapshot(WebAppContents):
+    def __init__(self, metadata, contents):
+        super().__init__(f"{metadata.get('plc')}/{metadata['app_name']}")
+        self.metadata = metadata
+        for resource in metadata["resources"]:
+            name = resource["name"]
+            last_modified = resource.get("last_modified") or metadata["created"]
+            try:
+                mtime = _parse_time(last_modified)
+            except ValueError as e:
+                raise ValueError(f"{name}: {e}") from None
+            self.add(name, contents[name], last_modified, attributes={
+                "mtime": mtime, "media_type": resource.get("media_type"), "visibility": resource.get("visibility")})
+
+    @property
+    def app_name(self):
+        return self.metadata["app_name"]
+
+    @property
+    def default_page(self):
+        return self.metadata.get("default_page")
+
+    # Write the snapshot to a zip archive, replacing it only once it is complete
+    def save(self, path):
+        temp_path = f"{path}.part"
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(METADATA_NAME, json.dumps(self.metadata, indent=1))
+            for name, _ in self.files:
+                archive.writestr(RESOURCE_DIR + name, self.contents[name])
+        os.replace(temp_path, path)
+        return path
+
+    # Read an archive written by save(). Raises ValueError if a resource does not match its checksum.
+    @classmethod
+    def load(cls, path):
+        with zipfile.ZipFile(path) as archive:
+            metadata = json.loads(archive.read(METADATA_NAME))
+            contents = {}
+            for resource in metadata["resources"]:
+                data = archive.read(RESOURCE_DIR + resource["name"])
+                if hashlib.sha256(data).hexdigest() != resource["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {resource['name']} in {path}")
+                contents[resource["name"]] = data
+        return cls(metadata, contents)
+
+
+# Download every resource of a web app into a WebAppSnapshot. Resources are fetched through
+# WebApp.DownloadResource tickets, opened and closed with one batch request per group of
+# max_open_tickets, and downloaded by workers threads. Returns None if the app or a resource
+# could not be read.
+def read_web_app(api, app_name, workers=4, max_open_tickets=8, log=print):
+    browse_result = api.web_app_browse()
+    app = next((app for app in (browse_result or {}).get("applications", []) if app["name"] == app_name), None)
+    resources_result = api.web_app_browse_resource(app_name)
+    if app is None or resources_result is None:
+        log(f"Web app '{app_name}' not found")
+        return None
+    # The manifest of a synced app describes the app on that PLC; deploying the snapshot writes a new one
+    resources = [resource for resource in resources_result.get("resources", []) if resource["name"] != MANIFEST_NAME]
+
+    contents = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(resources), max_open_tickets):
+            group = resources[start:start + max_open_tickets]
+            with api.batch():
+                calls = [api.web_app_download_resource(app_name, resource["name"]) for resource in group]
+
+            futures = {}
+            for resource, call in zip(group, calls):
+                if call.result:
+                    futures[executor.submit(api.download_bytes, call.result, resource.get("size"))] = resource
+                else:
+                    log(f"Download resource failed for {resource['name']}: {call.error}")
+                    failed.append(resource["name"])
+            for future in as_completed(futures):
+                resource = futures[future]
+                data = future.result()
+                if data is None:
+                    failed.append(resource["name"])
+                else:
+                    contents[resource["name"]] = bytes(data)
+
+            with api.batch():
+                for call in calls:
+                    if call.result:
+                        api.close_ticket(call.result)
+
+    if failed:
+        log(f"Reading '{app_name}' failed for {len(failed)} resources: {', '.join(failed)}")
+        return None
+
+    metadata = {
+        "app_name": app_name,
+        "default_page": app.get("default_page"),
+        "state": app.get("state"),
+        "plc": api.ip,
+        "created": WebApiSession._format_time(),
+        "resources": [{
+            "name": resource["name"],
+            "media_type": resource.get("media_type"),
+            "last_modified": resource.get("last_modified"),
+            "visibility": resource.get("visibility"),
+            "size": len(contents[resource["name"]]),
+            "sha256": hashlib.sha256(contents[resource["name"]]).hexdigest()
+        } for resource in resources]
+    }
+    log(f"Read '{app_name}': {len(resources)} resources, {sum(len(data) for data in contents.values())} bytes")
+    return WebAppSnapshot(metadata, contents)
+
+
+# Back up a web app into a zip archive. Returns the WebAppSnapshot, or None if reading failed.
+def backup_web_app(api, app_name, path, workers=4, max_open_tickets=8, log=print):
+    snapshot = read_web_app(api, app_name, workers, max_open_tickets, log)
+    if snapshot is not None:
+        snapshot.save(path)
+        log(f"Saved backup of '{app_name}' to {path}")
+    return snapshot
+
+
+# Deploy a snapshot (from read_web_app or WebAppSnapshot.load) to a PLC as app_name (default: the
+# original name) through a staged deploy, so the live app is only replaced once the copy is complete
+def restore_web_app(api, snapshot, app_name=None, workers=4, max_open_tickets=8, log=print, keep_previous=False):
+    return staged_deploy_web_app(api, app_name or snapshot.app_name, snapshot, snapshot.default_page, workers,
+                                 max_open_tickets, log, keep_previous=keep_previous)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Back up, restore and clone PLC web apps.")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default=os.environ.get("SIMATIC_PASSWORD", ""),
+                        help="password (default: SIMATIC_PASSWORD environment variable)")
+    parser.add_argument("--workers", type=int, default=4, help="transfers at the same time per PLC")
+    parser.add_argument("--max-open-tickets", type=int, default=8)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup = commands.add_parser("backup", help="download an app into a zip archive")
+    backup.add_argument("ip")
+    backup.add_argument("app_name")
+    backup.add_argument("archive")
+
+    restore = commands.add_parser("restore", help="deploy an archive to a PLC")
+    restore.add_argument("archive")
+    restore.add_argument("ip")
+    restore.add_argument("--app-name", help="name on the PLC (default: the archived name)")
+
+    clone = commands.add_parser("clone", help="copy an app from one PLC to others without storing it")
+    clone.add_argument("ip", help="source PLC")
+    clone.add_argument("app_name")
+    clone.add_argument("targets", nargs="+", help="target PLC addresses")
+    clone.add_argument("-p", "--parallel", type=int, default=8, help="target PLCs deployed at the same time")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    if args.command == "restore":
+        snapshot = WebAppSnapshot.load(args.archive)
+        with WebApiSession(args.ip, args.username, args.password, pool_maxsize=args.workers) as api:
+            if not api.login():
+                raise SystemExit("Login failed")
+            report = restore_web_app(api, snapshot, args.app_name, args.workers, args.max_open_tickets)
+        print(f"Restored in {time.perf_counter() - start_time:.2f} s")
+        return 0 if report.ok else 1
+
+    with WebApiSession(args.ip, args.username, args.password, pool_maxsize=args.workers) as api:
+        if not api.login():
+            raise SystemExit("Login failed")
+        if args.command == "backup":
+            snapshot = backup_web_app(api, args.app_name, args.archive, args.workers, args.max_open_tickets)
+        else:
+            snapshot = read_web_app(api, args.app_name, args.workers, args.max_open_tickets)
+    if snapshot is None:
+        return 1
+    if args.command == "backup":
+        return 0
+
+    targets = [{"ip": ip, "username": args.username, "password": args.password, "app_name": args.app_name,
+                "default_page": snapshot.default_page} for ip in args.targets]
+    results = deploy_fleet(targets, snapshot, args.parallel, args.workers, args.max_open_tickets, incremental=False)
+    print()
+    for result in results:
+        print(result.summary())
+    failed = sum(1 for result in results if not result.ok)
+    print(f"Cloned to {len(results) - failed}/{len(results)} PLCs in {time.perf_counter() - start_time:.2f} s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
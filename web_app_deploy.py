@@ -0,0 +1,608 @@
+import os
+import time
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from simatic_web_api import WebApiSession
+from transfer_journal import CLOSED, CREATED, FAILED, PLANNED, TRANSFERRED, backoff_delays
+
+
+# Result of uploading one resource. data holds the file contents if they were read in advance.
+# Resources held only in memory (path None) take mtime from the arguments; media_type and
+# visibility default to the PLC's choice.
+class ResourceUpload:
+    def __init__(self, name, path, data=None, mtime=None, media_type=None, visibility=None):
+        self.name = name
+        self.path = path
+        self.data = data
+        if data is None or mtime is None:
+            stat = os.stat(path)
+            self.size = stat.st_size if data is None else len(data)
+            self.mtime = stat.st_mtime if mtime is None else mtime
+        else:
+            self.size = len(data)
+            self.mtime = mtime
+        self.media_type = media_type
+        self.visibility = visibility
+        self.ticket_id = None
+        self.uploaded = False
+        self.closed = False
+        self.upload_time = 0.0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.uploaded and self.closed and self.error is None
+
+    @property
+    def throughput(self):
+        return self.size / self.upload_time if self.upload_time else 0.0
+
+    def __repr__(self):
+        return f"ResourceUpload({self.name}, {self.size} bytes, {self.upload_time:.3f} s, ok={self.ok})"
+
+
+# Summary of a web app deployment
+class DeployReport:
+    def __init__(self, app_name):
+        self.app_name = app_name
+        self.resources = []
+        self.deleted = []
+        self.unchanged = []
+        self.cancelled = False
+        self.error = None
+        self.start_time = time.perf_counter()
+        self.total_time = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None and all(resource.ok for resource in self.resources)
+
+    @property
+    def failed(self):
+        return [resource for resource in self.resources if not resource.ok]
+
+    @property
+    def total_bytes(self):
+        return sum(resource.size for resource in self.resources)
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.start_time
+        return self
+
+    def summary(self):
+        summary = (f"{len(self.resources) - len(self.failed)}/{len(self.resources)} resources, "
+                   f"{self.total_bytes} bytes in {self.total_time:.2f} s")
+        if self.unchanged or self.deleted:
+            summary += f", {len(self.unchanged)} unchanged, {len(self.deleted)} deleted"
+        if self.cancelled:
+            summary += ", cancelled"
+        if self.error:
+            summary += f", {self.error}"
+        return summary
+
+
+# Files directly inside folder, in a stable order
+def list_resource_files(folder):
+    return [(filename, os.path.join(folder, filename)) for filename in sorted(os.listdir(folder))
+            if os.path.isfile(os.path.join(folder, filename))]
+
+
+# Sums the bytes sent by all uploads of a deployment for the overall progress
+class _ProgressTotals:
+    def __init__(self, uploads, progress, cancel):
+        self.total = sum(upload.size for upload in uploads)
+        self.progress = progress
+        self.cancel = cancel
+        self.sent = {}
+        self.start_time = time.perf_counter()
+        self._lock = threading.Lock()
+
+    # Progress callback for one file. Raising aborts the upload when the deployment is cancelled.
+    def file_callback(self, name):
+        def callback(sent, total, elapsed):
+            if self.cancel is not None and self.cancel.is_set():
+                raise IOError("Cancelled")
+            if self.progress:
+                with self._lock:
+                    self.sent[name] = sent
+                    sent_total = sum(self.sent.values())
+                self.progress(name, sent, total, elapsed)
+                self.progress(None, sent_total, self.total, time.perf_counter() - self.start_time)
+        return callback
+
+
+def _upload_one(api, upload, totals):
+    if totals.cancel is not None and totals.cancel.is_set():
+        upload.error = "Cancelled"
+        return upload
+    start = time.perf_counter()
+    source = upload.path if upload.data is None else upload.data
+    upload.uploaded = bool(api.upload_file(upload.ticket_id, source, totals.file_callback(upload.name)))
+    upload.upload_time = time.perf_counter() - start
+    if not upload.uploaded:
+        upload.error = "Cancelled" if totals.cancel is not None and totals.cancel.is_set() else "Upload failed"
+    return upload
+
+
+# Create, upload and close web app resources.
+#
+# files:            list of (resource name, local path)
+# contents:         {resource name: bytes} of files read in advance (see LocalWebApp), others are read from disk
+# workers:          number of uploads running at the same time
+# max_open_tickets: tickets open on the PLC at the same time; resources are created and closed
+#                   in one batch request per group of this size
+# log:              called with progress messages, always from the calling thread
+# progress:         called as progress(name, bytes_sent, total_bytes, elapsed_seconds) from the upload threads,
+#                   once for the file and once with name None for all files together
+# cancel:           threading.Event; once set, running uploads are aborted and no new ones are started.
+#                   Opened tickets are still closed and skipped resources get the error "Cancelled".
+# retries:          attempts to upload failed resources again, after backoff_delays() between rounds
+# journal, job:     TransferJournal recording each resource's steps under the job name (see _job_name)
+# attributes:       {resource name: {"mtime", "media_type", "visibility"}} overriding what is taken from the files
+def upload_resources(api, app_name, files, workers=4, max_open_tickets=8, log=print, progress=None, cancel=None,
+                     contents=None, retries=0, journal=None, job=None, attributes=None):
+    contents = contents or {}
+    attributes = attributes or {}
+    uploads = [ResourceUpload(name, path, contents.get(name), **attributes.get(name, {})) for name, path in files]
+    totals = _ProgressTotals(uploads, progress, cancel)
+    delays = backoff_delays(retries)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = uploads
+        while True:
+            for start in range(0, len(pending), max_open_tickets):
+                _upload_group(api, app_name, pending[start:start + max_open_tickets], executor, totals, log,
+                              journal, job)
+
+            pending = [upload for upload in pending if not upload.ok and upload.error != "Cancelled"]
+            delay = next(delays, None)
+            if not pending or delay is None or (cancel is not None and cancel.is_set()):
+                break
+            log(f"Retrying {len(pending)} resources in {delay:.0f} s")
+            time.sleep(delay)
+            _reset_uploads(api, app_name, pending)
+
+    return uploads
+
+
+def _upload_group(api, app_name, group, executor, totals, log, journal, job):
+    if totals.cancel is not None and totals.cancel.is_set():
+        for upload in group:
+            upload.error = "Cancelled"
+        return
+
+    with api.batch():
+        calls = [api.web_app_create_resource(app_name, upload.name, upload.mtime, upload.visibility, upload.media_type)
+                 for upload in group]
+    for upload, call in zip(group, calls):
+        upload.ticket_id = call.result
+        if call.result is None:
+            upload.error = f"Create resource failed: {call.error}"
+            log(f"Create resource failed for {upload.name}: {call.error}")
+            if journal is not None:
+                journal.record(job, upload.name, FAILED, error=upload.error)
+        elif journal is not None:
+            journal.record(job, upload.name, CREATED, ticket_id=upload.ticket_id, ticket_closed=False)
+
+    futures = [executor.submit(_upload_one, api, upload, totals) for upload in group if upload.ticket_id]
+    for future in as_completed(futures):
+        upload = future.result()
+        if upload.uploaded:
+            log(f"Uploaded {upload.name}: {upload.size} bytes in {upload.upload_time:.3f} s")
+            if journal is not None:
+                journal.record(job, upload.name, TRANSFERRED, bytes=upload.size)
+        else:
+            log(f"Upload failed for {upload.name}: {upload.error}")
+
+    opened = [upload for upload in group if upload.ticket_id]
+    with api.batch():
+        closes = [api.close_ticket(upload.ticket_id) for upload in opened]
+    for upload, close in zip(opened, closes):
+        upload.closed = close.ok
+        if not close.ok:
+            log(f"Close ticket failed for {upload.name}: {close.error}")
+        if journal is not None:
+            step = CLOSED if upload.ok else FAILED
+            journal.record(job, upload.name, step, ticket_closed=close.ok, error=upload.error)
+
+
+# Prepare failed uploads for another attempt: resources created by the failed attempt are deleted,
+# so they can be created again with a new ticket
+def _reset_uploads(api, app_name, uploads):
+    with api.batch():
+        for upload in uploads:
+            if upload.ticket_id:
+                api.web_app_delete_resource(app_name, upload.name)
+    for upload in uploads:
+        upload.ticket_id = None
+        upload.uploaded = False
+        upload.closed = False
+        upload.upload_time = 0.0
+        upload.error = None
+
+
+# Replace a web app with the files of a folder: delete, create, upload resources and set the default page.
+# folder is a path or a WebAppContents (e.g. a LocalWebApp). progress, cancel and retries are passed to
+# upload_resources; a cancelled deployment does not set the default page.
+def deploy_web_app(api, app_name, folder, default_page, workers=4, max_open_tickets=8, log=print,
+                   progress=None, cancel=None, retries=0):
+    report = DeployReport(app_name)
+
+    log(f"Deleting existing app '{app_name}' if it exists...")
+    result = api.web_app_delete(app_name)
+    log(f"Web App Delete result: {result}")
+
+    log(f"Creating new app '{app_name}'...")
+    result = api.web_app_create(app_name)
+    log(f"Web App Create result: {result}")
+
+    log(f"Uploading files from folder: {folder}")
+    local_app = folder if isinstance(folder, WebAppContents) else None
+    files = local_app.files if local_app else list_resource_files(folder)
+    report.resources = upload_resources(api, app_name, files, workers, max_open_tickets, log, progress, cancel,
+                                        local_app.contents if local_app else None, retries,
+                                        attributes=local_app.attributes if local_app else None)
+    report.cancelled = cancel is not None and cancel.is_set()
+
+    if not report.cancelled:
+        log(f"Setting default page to: {default_page}")
+        result = api.web_app_set_default_page(app_name, default_page)
+        log(f"Set default page result: {result}")
+
+    report.finish()
+    log(f"Deployed {report.summary()}")
+    return report
+
+
+# Suffixes of the shadow app a staged deploy uploads into, and of the app it replaces
+STAGED_SUFFIX = "_staged"
+PREVIOUS_SUFFIX = "_previous"
+
+
+# Compare the resources of an app with what was uploaded. Returns a list of problems, empty if all match.
+def verify_resources(api, app_name, uploads):
+    result = api.web_app_browse_resource(app_name)
+    if result is None:
+        return [f"Browsing resources of '{app_name}' failed"]
+    remote = {resource["name"]: resource for resource in result.get("resources", [])}
+    problems = []
+    for upload in uploads:
+        entry = remote.get(upload.name)
+        if entry is None:
+            problems.append(f"{upload.name} is missing")
+        elif entry.get("size") is not None and entry["size"] != upload.size:
+            problems.append(f"{upload.name} has {entry['size']} bytes, expected {upload.size}")
+    return problems
+
+
+def _clear_job(journal, job):
+    if journal is not None:
+        journal.clear(job)
+
+
+# Keep the resources of a shadow app left by an interrupted staged deploy that the journal has as
+# completed, and delete the rest. Returns the names kept.
+def _resume_shadow(api, shadow_name, journal, job, names, local_manifest, log):
+    browse_result = api.web_app_browse_resource(shadow_name)
+    if browse_result is None:
+        return []
+    remote_resources = browse_result.get("resources", [])
+    resumed = _resumed_resources(journal, job, names, local_manifest, remote_resources)
+    if not resumed:
+        return []
+
+    # Partly uploaded resources and ones no longer in the folder
+    stale = [resource["name"] for resource in remote_resources if resource["name"] not in resumed]
+    if stale:
+        with api.batch() as batch:
+            for name in stale:
+                api.web_app_delete_resource(shadow_name, name)
+        for call in batch.errors:
+            log(f"Delete resource failed for {call.body['params']['name']}: {call.error}")
+    return resumed
+
+
+def _finish_staged(report, log):
+    report.finish()
+    log(f"Staged deploy: {report.summary()}")
+    return report
+
+
+# Deploy into a shadow app and switch over once it is complete, so the live app stays available while
+# uploading (deploy_web_app deletes it first):
+#
+# 1. Upload all resources into "<app_name>_staged" and set its default page
+# 2. Verify the resources with WebApp.BrowseResources
+# 3. Swap with one batch request: rename the live app to "<app_name>_previous" and the shadow app to app_name
+# 4. Delete the previous app, unless keep_previous is set (it is then kept until the next staged deploy)
+#
+# If anything fails before the swap, the shadow app is deleted and the live app is left as it was.
+# If the swap fails half way, the previous app is renamed back.
+#
+# With a TransferJournal the uploads into the shadow app are recorded as in sync_web_app. A run interrupted
+# by a crash or a lost connection leaves the shadow app in place; the next run keeps the resources the
+# journal has as closed with the same content hash and size, and uploads only the rest.
+def staged_deploy_web_app(api, app_name, folder, default_page, workers=4, max_open_tickets=8, log=print,
+                          progress=None, cancel=None, keep_previous=False, retries=0, journal=None):
+    report = DeployReport(app_name)
+    shadow_name = f"{app_name}{STAGED_SUFFIX}"
+    previous_name = f"{app_name}{PREVIOUS_SUFFIX}"
+
+    browse_result = api.web_app_browse()
+    if browse_result is None:
+        report.error = "Browsing web apps failed"
+        return _finish_staged(report, log)
+    existing = {app["name"] for app in browse_result.get("applications", [])}
+
+    local_app = folder if isinstance(folder, WebAppContents) else None
+    files = local_app.files if local_app else list_resource_files(folder)
+    job = _job_name(api, shadow_name)
+    resumed = []
+    if journal is not None:
+        local_manifest = local_app.manifest if local_app else build_manifest(files)
+        if shadow_name in existing and journal.job_items(job):
+            resumed = _resume_shadow(api, shadow_name, journal, job, [name for name, _ in files], local_manifest,
+                                     log)
+        if not resumed:
+            journal.clear(job)
+
+    # Left over from an earlier run; the shadow app is kept if uploading into it is resumed
+    stale = [name for name in (shadow_name, previous_name)
+             if name in existing and not (resumed and name == shadow_name)]
+    if stale:
+        with api.batch():
+            for name in stale:
+                api.web_app_delete(name)
+
+    if resumed:
+        log(f"Resuming upload into '{shadow_name}': {len(resumed)} resources were completed by an earlier run")
+    else:
+        log(f"Uploading into '{shadow_name}'...")
+        if not api.web_app_create(shadow_name):
+            report.error = f"Creating '{shadow_name}' failed"
+            return _finish_staged(report, log)
+
+    if journal is not None:
+        files = [(name, path) for name, path in files if name not in resumed]
+        for name, _ in files:
+            journal.record(job, name, PLANNED, sha256=local_manifest[name]["sha256"])
+    report.unchanged = resumed
+    report.resources = upload_resources(api, shadow_name, files, workers, max_open_tickets, log, progress, cancel,
+                                        local_app.contents if local_app else None, retries, journal, job,
+                                        local_app.attributes if local_app else None)
+    report.cancelled = cancel is not None and cancel.is_set()
+
+    if report.ok and not report.cancelled:
+        if default_page and not api.web_app_set_default_page(shadow_name, default_page):
+            report.error = "Setting the default page failed"
+        else:
+            problems = verify_resources(api, shadow_name, report.resources)
+            if problems:
+                report.error = f"Verification failed: {'; '.join(problems)}"
+
+    if not report.ok or report.cancelled:
+        log(f"Discarding '{shadow_name}', '{app_name}' is unchanged")
+        api.web_app_delete(shadow_name)
+        _clear_job(journal, job)
+        return _finish_staged(report, log)
+
+    log(f"Switching '{app_name}' to the new version...")
+    live_exists = app_name in existing
+    with api.batch():
+        retire = api.web_app_rename(app_name, previous_name) if live_exists else None
+        promote = api.web_app_rename(shadow_name, app_name)
+
+    if not promote.ok:
+        report.error = f"Switching over failed: {promote.error}"
+        if retire is not None and retire.ok:
+            result = api.web_app_rename(previous_name, app_name)
+            log(f"Rolled back to the previous version: {result}")
+        api.web_app_delete(shadow_name)
+        _clear_job(journal, job)
+        return _finish_staged(report, log)
+
+    _clear_job(journal, job)
+    if live_exists and not keep_previous:
+        result = api.web_app_delete(previous_name)
+        log(f"Deleted previous version: {result}")
+    return _finish_staged(report, log)
+
+
+# Name of the resource holding the content manifest of a synced app
+MANIFEST_NAME = "deploy-manifest.json"
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Content manifest of local files: {name: {"sha256", "size", "last_modified"}}
+def build_manifest(files):
+    manifest = {}
+    for name, path in files:
+        stat = os.stat(path)
+        manifest[name] = {
+            "sha256": _file_sha256(path),
+            "size": stat.st_size,
+            "last_modified": WebApiSession._format_time(stat.st_mtime)
+        }
+    return manifest
+
+
+# Resources of a web app held in memory, which deploy_web_app, staged_deploy_web_app and sync_web_app
+# take in place of a folder: files as [(name, path or None)], contents, the content manifest and the
+# upload_resources() attributes of resources that do not come from a folder (see WebAppSnapshot).
+class WebAppContents:
+    def __init__(self, folder):
+        self.folder = folder
+        self.files = []
+        self.contents = {}
+        self.manifest = {}
+        self.attributes = {}
+
+    def add(self, name, data, last_modified, path=None, attributes=None):
+        self.files.append((name, path))
+        self.contents[name] = data
+        self.manifest[name] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data),
+                               "last_modified": last_modified}
+        if attributes:
+            self.attributes[name] = attributes
+
+    @property
+    def total_bytes(self):
+        return sum(len(data) for data in self.contents.values())
+
+    def __str__(self):
+        return self.folder
+
+
+# Files of a web app folder read and hashed once, to deploy the same app to many PLCs
+# without going back to the disk for every target
+class LocalWebApp(WebAppContents):
+    def __init__(self, folder):
+        super().__init__(folder)
+        for name, path in list_resource_files(folder):
+            with open(path, "rb") as file:
+                data = file.read()
+            self.add(name, data, WebApiSession._format_time(os.stat(path).st_mtime), path)
+
+
+# Read the manifest stored in the app, or an empty one if it is missing or unreadable
+def read_remote_manifest(api, app_name, manifest_name=MANIFEST_NAME):
+    ticket_id = api.web_app_download_resource(app_name, manifest_name)
+    if not ticket_id:
+        return {}
+    try:
+        content = api.download_bytes(ticket_id)
+    finally:
+        api.close_ticket(ticket_id)
+    try:
+        return json.loads(content.tobytes()) if content else {}
+    except ValueError:
+        return {}
+
+
+# Compare local files against the app. Returns (names to upload, names to delete, unchanged names).
+# Resources are compared by content hash when the stored manifest has them, otherwise by size and last_modified.
+def diff_manifest(local_manifest, remote_resources, remote_manifest, manifest_name=MANIFEST_NAME):
+    remote = {resource["name"]: resource for resource in remote_resources if resource["name"] != manifest_name}
+    upload, unchanged = [], []
+    for name, entry in local_manifest.items():
+        if name not in remote:
+            changed = True
+        elif name in remote_manifest:
+            changed = remote_manifest[name].get("sha256") != entry["sha256"]
+        else:
+            changed = (remote[name].get("size") != entry["size"]
+                       or remote[name].get("last_modified") != entry["last_modified"])
+        if changed:
+            upload.append(name)
+        else:
+            unchanged.append(name)
+    delete = [name for name in remote if name not in local_manifest]
+    return upload, delete, unchanged
+
+
+# Journal job of a web app on a PLC
+def _job_name(api, app_name):
+    return f"{api.ip}/{app_name}"
+
+
+# Resources to upload that an earlier, interrupted run of the same job already completed
+def _resumed_resources(journal, job, upload, local_manifest, remote_resources):
+    sizes = {resource["name"]: resource.get("size") for resource in remote_resources}
+    resumed = []
+    for name in upload:
+        state = journal.state(job, name)
+        if (state and state.get("step") == CLOSED and state.get("sha256") == local_manifest[name]["sha256"]
+                and sizes.get(name) == local_manifest[name]["size"]):
+            resumed.append(name)
+    return resumed
+
+
+# Bring a web app in line with a folder, uploading only new or changed files and deleting removed ones.
+# The app is created if it does not exist yet. A manifest of content hashes is stored in the app as a
+# protected resource so the next sync can detect changes without downloading resources.
+# folder is a path or a WebAppContents (e.g. a LocalWebApp).
+#
+# With a TransferJournal the steps of every resource are recorded, so a sync interrupted by a crash or a
+# lost connection resumes where it stopped: resources the journal has as closed with the same content hash,
+# and which the PLC has with the right size, are not uploaded again. The job is cleared once the sync has
+# completed. retries is passed to upload_resources.
+def sync_web_app(api, app_name, folder, default_page, workers=4, max_open_tickets=8, log=print,
+                 manifest_name=MANIFEST_NAME, progress=None, cancel=None, journal=None, retries=0):
+    report = DeployReport(app_name)
+
+    local_app = folder if isinstance(folder, WebAppContents) else None
+    files = local_app.files if local_app else list_resource_files(folder)
+    paths = dict(files)
+    local_manifest = local_app.manifest if local_app else build_manifest(files)
+
+    browse_result = api.web_app_browse_resource(app_name)
+    if browse_result is None:
+        log(f"Creating new app '{app_name}'...")
+        result = api.web_app_create(app_name)
+        log(f"Web App Create result: {result}")
+        remote_resources, remote_manifest = [], {}
+    else:
+        remote_resources = browse_result.get("resources", [])
+        has_manifest = any(resource["name"] == manifest_name for resource in remote_resources)
+        remote_manifest = read_remote_manifest(api, app_name, manifest_name) if has_manifest else {}
+
+    upload, delete, unchanged = diff_manifest(local_manifest, remote_resources, remote_manifest, manifest_name)
+    job = _job_name(api, app_name)
+    if journal is not None:
+        resumed = _resumed_resources(journal, job, upload, local_manifest, remote_resources)
+        if resumed:
+            log(f"Resuming: {len(resumed)} resources were completed by an earlier run")
+            upload = [name for name in upload if name not in resumed]
+            unchanged += resumed
+        for name in upload:
+            journal.record(job, name, PLANNED, sha256=local_manifest[name]["sha256"])
+    remote_names = {resource["name"] for resource in remote_resources}
+    replace = [name for name in upload if name in remote_names]
+    log(f"{len(upload)} to upload, {len(delete)} to delete, {len(unchanged)} unchanged")
+
+    report.deleted = delete
+    report.unchanged = unchanged
+    if upload or delete or remote_manifest != local_manifest:
+        # Changed resources are deleted and recreated, together with the old manifest
+        stale = delete + replace + ([manifest_name] if manifest_name in remote_names else [])
+        if stale:
+            with api.batch() as batch:
+                for name in stale:
+                    api.web_app_delete_resource(app_name, name)
+            for call in batch.errors:
+                log(f"Delete resource failed for {call.body['params']['name']}: {call.error}")
+
+        report.resources = upload_resources(api, app_name, [(name, paths[name]) for name in upload],
+                                            workers, max_open_tickets, log, progress, cancel,
+                                            local_app.contents if local_app else None, retries, journal, job,
+                                            local_app.attributes if local_app else None)
+        report.cancelled = cancel is not None and cancel.is_set()
+
+        # Only record files that made it to the PLC, so failed ones are retried next time
+        failed = {resource.name for resource in report.failed}
+        stored_manifest = {name: entry for name, entry in local_manifest.items() if name not in failed}
+        ticket_id = api.web_app_create_resource(app_name, manifest_name, visibility="protected")
+        if ticket_id:
+            stored = api.upload_file(ticket_id, json.dumps(stored_manifest, indent=1).encode())
+            api.close_ticket(ticket_id)
+            if journal is not None and stored and report.ok and not report.cancelled:
+                journal.clear(job)
+    else:
+        log(f"App '{app_name}' is up to date")
+
+    if default_page and not report.cancelled:
+        result = api.web_app_set_default_page(app_name, default_page)
+        log(f"Set default page result: {result}")
+
+    report.finish()
+    log(f"Synced {report.summary()}")
+    return report